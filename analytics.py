@@ -0,0 +1,131 @@
+# filename: analytics.py
+
+import logging
+import math
+
+from event import notify, Event
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400.0
+
+class GravityTrend:
+    """Recursive least-squares line through gravity readings with exponential forgetting.
+
+    Readings lose weight with age as exp(-age / window), so the fit follows
+    the recent trend over roughly window seconds. The weighted sums are kept
+    relative to the newest reading and shifted on every update, which keeps
+    each update constant time and numerically well conditioned.
+    """
+
+    def __init__(self, window=SECONDS_PER_DAY):
+        self.window = float(window)
+        self.last = None
+        self.first = None
+        self.s0 = self.s1 = self.s2 = self.sy = self.sty = 0.0
+
+    def update(self, now, gravity):
+        if self.last is None:
+            self.first = self.last = now
+        dt = now - self.last
+        if dt < 0:
+            return
+        decay = math.exp(-dt / self.window)
+        # Move the time origin to now (t -> t - dt), then forget
+        self.s2 = (self.s2 - 2.0 * dt * self.s1 + dt * dt * self.s0) * decay
+        self.sty = (self.sty - dt * self.sy) * decay
+        self.s1 = (self.s1 - dt * self.s0) * decay
+        self.s0 *= decay
+        self.sy *= decay
+        self.s0 += 1.0
+        self.sy += gravity
+        self.last = now
+
+    def span(self):
+        return 0.0 if self.first is None else self.last - self.first
+
+    def fit(self):
+        """Returns (gravity now, slope per second) or None while the readings cannot define a line."""
+        det = self.s0 * self.s2 - self.s1 * self.s1
+        if self.s0 < 2 or det <= 1e-12 * self.s0 * self.s2:
+            return None
+        slope = (self.s0 * self.sty - self.s1 * self.sy) / det
+        return (self.sy - slope * self.s1) / self.s0, slope
+
+class FermentationAnalytics:
+    """Fermentation rate, ETA to terminal gravity and stall detection for one controller.
+
+    Fed with the controller sensor's gravity events. Results are notified as
+    <controller>.gravityRate (points/day), <controller>.gravityEta (hours)
+    and <controller>.stalled (on change).
+
+    Settings:
+      window:        seconds of readings the trend follows (default one day)
+      finalGravity:  expected terminal gravity; otherwise from attenuation
+      attenuation:   expected apparent attenuation in percent (default 75)
+      stallRate:     points/day below which an unfinished fermentation is stalled (default 1)
+    """
+
+    def __init__(self, name, sensor, window=SECONDS_PER_DAY, finalGravity=None, attenuation=75.0, stallRate=1.0):
+        self.name = name
+        self.sensor = sensor
+        self.trend = GravityTrend(window)
+        self.finalGravity = finalGravity
+        self.attenuation = float(attenuation)
+        self.stallRate = float(stallRate)
+        self.gravity = None
+        self.rate = None
+        self.eta = None
+        self.stalled = False
+
+    def adopt(self, previous):
+        """Continues the trend and results of the estimator this one replaces on a config reload."""
+        window = self.trend.window
+        self.trend = previous.trend
+        self.trend.window = window
+        self.gravity, self.rate, self.eta, self.stalled = previous.gravity, previous.rate, previous.eta, previous.stalled
+
+    def terminalGravity(self):
+        if self.finalGravity is not None:
+            return float(self.finalGravity)
+        og = self.sensor.ograv() if self.sensor is not None else None
+        if og is None:
+            return None
+        return 1.0 + (float(og) - 1.0) * (1.0 - self.attenuation / 100.0)
+
+    def update(self, now, gravity):
+        self.trend.update(now, float(gravity))
+        fit = self.trend.fit()
+        if fit is None or self.trend.span() < self.trend.window / 4:
+            return  # Too little history for a meaningful trend
+        self.gravity, slope = fit
+        self.rate = -slope * SECONDS_PER_DAY * 1000.0 + 0.0
+        fg = self.terminalGravity()
+        remaining = None if fg is None else (self.gravity - fg) * 1000.0
+        if remaining is not None and remaining <= 0:
+            self.eta = 0.0
+        elif remaining is not None and self.rate > 0:
+            self.eta = remaining / self.rate * 24.0
+        else:
+            self.eta = None
+
+        og = self.sensor.ograv() if self.sensor is not None else None
+        started = og is not None and (float(og) - self.gravity) * 1000.0 >= 5.0
+        stalled = (started and remaining is not None and remaining > 2.0
+                   and self.trend.span() >= self.trend.window and self.rate < self.stallRate)
+        if stalled != self.stalled:
+            self.stalled = stalled
+            if stalled:
+                logger.warning(f"{self.name}: fermentation stalled at {self.gravity:.3f} ({self.rate:.2f} points/day)")
+            notify(Event(source=self.name, endpoint='stalled', data=self.stalled))
+
+        notify(Event(source=self.name, endpoint='gravityRate', data=round(self.rate, 2)))
+        if self.eta is not None:
+            notify(Event(source=self.name, endpoint='gravityEta', data=round(self.eta, 1)))
+
+    def getDetails(self):
+        return {
+            'gravityRate': None if self.rate is None else round(self.rate, 2),
+            'gravityEta': None if self.eta is None else round(self.eta, 1),
+            'stalled': self.stalled,
+        }
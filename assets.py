@@ -0,0 +1,172 @@
+# filename: assets.py
+
+# Static asset pipeline for the web UI.
+#
+# Every file under static/ gets a content-hashed name (libs/vue.global.prod.3f2a9c1b2d.js)
+# served with an immutable Cache-Control, plus gzip and, when the brotli package is
+# installed, brotli variants picked by Accept-Encoding. References in the HTML pages
+# and stylesheets are rewritten to the hashed names; the pages themselves keep their
+# names and are revalidated with an ETag. Compressed variants are cached on disk, so
+# only the first start after an asset changes pays for compression. To build ahead
+# of time (e.g. in the Docker image): python assets.py
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+REWRITTEN = ('.html', '.css')
+HTML_REFERENCE = re.compile(r'''((?:src|href)\s*=\s*["'])([^"'#?]+)''')
+CSS_REFERENCE = re.compile(r'''(url\(\s*["']?)([^"')#?]+)''')
+# Names of the compressed variants cached on disk; nothing else in the cache directory is touched
+CACHE_FILE = re.compile(r'^[0-9a-f]{10}\.(?:gz|br)$')
+
+class Asset:
+    """One static file with its compressed variants."""
+
+    def __init__(self, name, body, hashed):
+        self.name = name
+        self.digest = hashlib.sha256(body).hexdigest()[:10]
+        if hashed:
+            root, ext = posixpath.splitext(name)
+            self.url = f"{root}.{self.digest}{ext}"
+        else:
+            self.url = name
+        self.hashed = hashed
+        self.contentType = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.etag = f'"{self.digest}"'
+        self.variants = {'identity': body}
+
+    def compress(self, cacheDir, brotliQuality):
+        body = self.variants['identity']
+        codecs = [('gzip', 'gz', lambda data: gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            codecs.insert(0, ('br', 'br', lambda data: brotli.compress(data, quality=brotliQuality)))
+        for encoding, suffix, codec in codecs:
+            path = os.path.join(cacheDir, f"{self.digest}.{suffix}") if cacheDir else None
+            if path and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    compressed = f.read()
+            else:
+                compressed = codec(body)
+                if path:
+                    with open(path, 'wb') as f:
+                        f.write(compressed)
+            # Fonts and images that are already compressed are served as they are
+            if len(compressed) < 0.9 * len(body):
+                self.variants[encoding] = compressed
+
+    def cacheFiles(self):
+        return {f"{self.digest}.gz", f"{self.digest}.br"}
+
+class AssetPipeline:
+    """Builds the hashed and compressed assets of a directory and serves them."""
+
+    def __init__(self, root, cacheDir='.assetcache', brotliQuality=11):
+        self.root = root
+        self.cacheDir = cacheDir
+        self.brotliQuality = brotliQuality
+        self.byName = {}
+        self.byUrl = {}
+
+    def files(self):
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), path
+
+    def rewrite(self, name, body):
+        """Points references in a page or stylesheet at the hashed names built so far."""
+        pattern = HTML_REFERENCE if name.endswith('.html') else CSS_REFERENCE
+        base = posixpath.dirname(name)
+
+        def replace(match):
+            prefix, reference = match.groups()
+            if re.match(r'^[a-z]+:|^/', reference):
+                return match.group(0)
+            target = self.byName.get(posixpath.normpath(posixpath.join(base, reference)))
+            if target is None:
+                return match.group(0)
+            return prefix + posixpath.relpath(target.url, base or '.')
+        return pattern.sub(replace, body.decode('utf-8', 'surrogateescape')).encode('utf-8', 'surrogateescape')
+
+    def build(self):
+        if self.cacheDir:
+            os.makedirs(self.cacheDir, exist_ok=True)
+        # Stylesheets refer to fonts and pages to everything, so they are hashed after what they reference
+        order = lambda item: (item[0].endswith('.html'), item[0].endswith('.css'), item[0])
+        for name, path in sorted(self.files(), key=order):
+            with open(path, 'rb') as f:
+                body = f.read()
+            if name.endswith(REWRITTEN):
+                body = self.rewrite(name, body)
+            asset = Asset(name, body, hashed=not name.endswith('.html'))
+            asset.compress(self.cacheDir, self.brotliQuality)
+            self.byName[name] = asset
+            self.byUrl[asset.url] = asset
+        if self.cacheDir:
+            keep = set().union(*(asset.cacheFiles() for asset in self.byName.values()))
+            for stale in {name for name in os.listdir(self.cacheDir) if CACHE_FILE.match(name)} - keep:
+                os.remove(os.path.join(self.cacheDir, stale))
+        identity = sum(len(a.variants['identity']) for a in self.byName.values())
+        smallest = sum(min(len(v) for v in a.variants.values()) for a in self.byName.values())
+        logger.info(f"Built {len(self.byName)} static assets, {identity} bytes, {smallest} compressed"
+                    f"{'' if brotli else ' (brotli not installed, gzip only)'}")
+        return self
+
+    @staticmethod
+    def acceptedEncodings(header):
+        accepted = set()
+        for part in header.split(','):
+            token, _, params = part.strip().partition(';')
+            q = params.strip()
+            try:
+                if q.startswith('q=') and float(q[2:] or 0) == 0:
+                    continue
+            except ValueError:
+                continue
+            accepted.add(token.strip().lower())
+        return accepted
+
+    async def handle(self, request):
+        path = request.match_info['path']
+        asset = self.byUrl.get(path)
+        immutable = asset is not None and asset.hashed
+        if asset is None:
+            # Unhashed names still work, they just have to be revalidated
+            asset = self.byName.get(path)
+        if asset is None:
+            raise web.HTTPNotFound()
+        headers = {'Cache-Control': IMMUTABLE if immutable else REVALIDATE, 'ETag': asset.etag,
+                   'Vary': 'Accept-Encoding'}
+        if asset.etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers=headers)
+        accepted = self.acceptedEncodings(request.headers.get('Accept-Encoding', ''))
+        encoding = next((e for e in ('br', 'gzip') if e in accepted and e in asset.variants), 'identity')
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return web.Response(body=asset.variants[encoding], content_type=asset.contentType, headers=headers)
+
+def setup(app, root='static', prefix='/static', cacheDir='.assetcache', brotliQuality=11):
+    """Builds the assets under root and serves them under prefix."""
+    pipeline = AssetPipeline(root, cacheDir, brotliQuality).build()
+    app.router.add_get(prefix + '/{path:.*}', pipeline.handle)
+    return pipeline
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    AssetPipeline(sys.argv[1] if len(sys.argv) > 1 else 'static').build()
@@ -0,0 +1,265 @@
+# filename: autotune.py
+
+# PID auto-tuning for PIDLogic.
+#
+# A first-order-plus-dead-time (FOPDT) model is identified from recorded
+# temperature and power history, then thousands of candidate coefficient sets
+# are simulated against it in one vectorized NumPy run and scored on
+# overshoot, settling time and actuator movement.
+#
+# Offline use:
+#   python autotune.py history.json         (saved from /controllers/{name}/datahistory)
+#   python autotune.py http://pi:8080/controllers/Fridge/datahistory
+#   python autotune.py history.csv          (columns: time,temperature,power)
+
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = {'iae': 1.0, 'overshoot': 2.0, 'settling': 1.0, 'switching': 0.05}
+
+class FOPDTModel:
+    """dT/dt = (ambient + gain * power(t - deadTime) - T) / timeConstant, power in percent."""
+
+    def __init__(self, gain, timeConstant, deadTime, ambient, rmse):
+        self.gain = gain
+        self.timeConstant = timeConstant
+        self.deadTime = deadTime
+        self.ambient = ambient
+        self.rmse = rmse
+
+    def asDict(self):
+        return {'gain': self.gain, 'timeConstant': self.timeConstant, 'deadTime': self.deadTime,
+                'ambient': self.ambient, 'rmse': self.rmse}
+
+def resample(times, temps, powers, dt):
+    """Puts history on a uniform grid: temperature interpolated, power held until the next sample."""
+    times = np.asarray(times, dtype=float)
+    temps = np.asarray(temps, dtype=float)
+    powers = np.asarray(powers, dtype=float)
+    valid = np.isfinite(times) & np.isfinite(temps) & np.isfinite(powers)
+    times, temps, powers = times[valid], temps[valid], powers[valid]
+    order = np.argsort(times, kind='stable')
+    times, temps, powers = times[order], temps[order], powers[order]
+    if len(times) < 10:
+        raise ValueError(f"Need at least 10 samples of history, got {len(times)}")
+    grid = np.arange(times[0], times[-1], dt)
+    held = np.clip(np.searchsorted(times, grid, side='right') - 1, 0, len(times) - 1)
+    return grid, np.interp(grid, times, temps), powers[held]
+
+def fitGrid(temp, power, dt, taus, delays):
+    """Returns (sse, timeConstant, delaySteps, (gain, transient, ambient)) of the best fit on the grid."""
+    n = len(temp)
+    decays = np.exp(-dt / taus)
+
+    # First order response to the power history for every time constant at once
+    responses = np.empty((n, len(taus)))
+    responses[0] = power[0]
+    for k in range(1, n):
+        responses[k] = decays * responses[k - 1] + (1.0 - decays) * power[k - 1]
+
+    best = None
+    steps = np.arange(n)
+    for j, decay in enumerate(decays):
+        # Regressors per dead time: delayed response, decaying initial transient, constant
+        shifted = np.stack([np.concatenate((np.full(d, power[0]), responses[:n - d, j])) for d in delays])
+        X = np.stack((shifted, np.broadcast_to(decay ** steps, shifted.shape), np.ones_like(shifted)), axis=-1)
+        XtX = np.einsum('dki,dkj->dij', X, X)
+        Xty = np.einsum('dki,k->di', X, temp)
+        try:
+            coeffs = np.linalg.solve(XtX, Xty[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            continue
+        sse = np.sum((np.einsum('dki,di->dk', X, coeffs) - temp) ** 2, axis=1)
+        i = int(np.argmin(sse))
+        if best is None or sse[i] < best[0]:
+            best = (float(sse[i]), float(taus[j]), int(delays[i]), coeffs[i])
+    return best
+
+def identify(times, temps, powers, dt=10.0, maxDeadTime=3600.0, grid=40, maxPoints=5000):
+    """Fits an FOPDT model to history, searching time constants and dead times coarse to fine.
+
+    The fit compares the simulated model output with the measured
+    temperature (output error) rather than predicting one sample ahead, so
+    sensor noise and quantization do not bias the model. For each time
+    constant and dead time, gain, ambient and the initial transient are
+    solved by least squares.
+    """
+    times = np.asarray(times, dtype=float)
+    span = np.nanmax(times) - np.nanmin(times)
+    dt = max(dt, span / maxPoints)
+    _, temp, power = resample(times, temps, powers, dt)
+    if np.ptp(power) == 0:
+        raise ValueError("Power never changes in this history, so the process cannot be identified")
+    n = len(temp)
+    maxDelay = int(min(maxDeadTime / dt, n // 4))
+
+    taus = np.logspace(np.log10(2 * dt), np.log10(10 * n * dt), grid)
+    delays = np.unique(np.linspace(0, maxDelay, grid).astype(int))
+    best = fitGrid(temp, power, dt, taus, delays)
+    if best is None:
+        raise ValueError("No first order model fits this history")
+
+    # Refine between the neighbouring coarse grid points
+    ratio = taus[1] / taus[0]
+    spacing = max(int(np.ceil(maxDelay / grid)), 1)
+    taus = best[1] * np.logspace(-np.log10(ratio), np.log10(ratio), grid)
+    delays = np.arange(max(best[2] - spacing, 0), min(best[2] + spacing, maxDelay) + 1)
+    best = min(best, fitGrid(temp, power, dt, taus, delays) or best, key=lambda fit: fit[0])
+
+    sse, tau, delay, (gain, transient, ambient) = best
+    return FOPDTModel(gain=float(gain), timeConstant=tau, deadTime=float(delay * dt),
+                      ambient=float(ambient), rmse=float(np.sqrt(sse / n)))
+
+def candidateGrid(model, size=3200):
+    """Candidate (p, i, d) sets in PIDLogic units, spread log-uniformly around the SIMC tuning of the model."""
+    tau, theta, gain = model.timeConstant, max(model.deadTime, 1.0), abs(model.gain)
+    kc = tau / (gain * 2.0 * theta)
+    ti = min(tau, 8.0 * theta)
+    side = max(int(round((size / 8) ** 0.5)), 2)
+    kcs = kc * np.logspace(-1.0, 1.0, side)
+    tis = ti * np.logspace(-1.0, 1.0, side)
+    tds = np.concatenate(([0.0], theta * np.logspace(-1.0, 0.5, 7)))
+    kc, ti, td = (m.ravel() for m in np.meshgrid(kcs, tis, tds, indexing='ij'))
+    # PIDLogic integrates error / i per second and subtracts d * dInput / dt, independent of p
+    sign = np.sign(model.gain)
+    return sign * kc, sign * ti / kc, sign * kc * td + 0.0
+
+def simulate(model, p, i, d, dt=10.0, step=2.0, power=25.0, outputMin=0.0, outputMax=100.0, maxSteps=3000, seed=0):
+    """Steps every candidate through the same setpoint change at once and returns their metrics.
+
+    The process starts settled at the given power; the setpoint then moves
+    by step degrees in the direction that needs more power. Candidates are
+    computed exactly as PIDLogic does, including its anti-windup, and see
+    the same sensor noise (the model's fit error), so noisy derivative
+    action shows up as actuator movement.
+    """
+    p, i, d = (np.asarray(x, dtype=float) for x in (p, i, d))
+    horizon = 8.0 * (model.timeConstant + model.deadTime)
+    dt = max(dt, horizon / maxSteps)
+    steps = int(horizon / dt)
+    delay = int(round(model.deadTime / dt))
+    decay = np.exp(-dt / model.timeConstant)
+
+    start = model.ambient + model.gain * power
+    # Shrink the step if the actuator could not hold the new setpoint
+    reachable = 0.8 * (outputMax - power) * abs(model.gain)
+    step = min(abs(step), reachable) * np.sign(model.gain)
+    setpoint = start + step
+    band = max(0.05 * abs(step), 0.1)
+
+    count = len(p)
+    temp = np.full(count, start)
+    lastInput = temp.copy()  # Noise free, so the first derivative term does not kick
+    lastOutput = np.full(count, power)
+    iTerm = np.full(count, power)
+    ki = dt / i
+    kd = d / dt
+    pipeline = np.full((delay + 1, count), power)
+    noise = np.random.default_rng(seed).normal(0.0, model.rmse, steps + 1)
+
+    iae = np.zeros(count)
+    overshoot = np.zeros(count)
+    switching = np.zeros(count)
+    lastOutside = np.zeros(count)
+    for k in range(steps):
+        measured = temp + noise[k]
+        error = setpoint - measured
+        unsaturated = (lastOutput < outputMax) & (lastOutput > outputMin)
+        iTerm = np.clip(iTerm + np.where(unsaturated, ki * error, 0.0), outputMin, outputMax)
+        output = np.clip(p * error + iTerm - kd * (measured - lastInput), outputMin, outputMax)
+        switching += np.abs(output - lastOutput) / (outputMax - outputMin)
+        lastInput = measured
+        lastOutput = output
+
+        pipeline[k % (delay + 1)] = output
+        applied = pipeline[(k + 1) % (delay + 1)]
+        temp = model.ambient + model.gain * applied + (temp - model.ambient - model.gain * applied) * decay
+
+        deviation = temp - setpoint
+        iae += np.abs(deviation) * dt
+        overshoot = np.maximum(overshoot, deviation * np.sign(step))
+        lastOutside = np.where(np.abs(deviation) > band, (k + 1) * dt, lastOutside)
+
+    return {'iae': iae, 'overshoot': overshoot, 'settling': lastOutside, 'switching': switching,
+            'horizon': steps * dt, 'step': float(abs(step))}
+
+def score(metrics, weights=None):
+    """Lower is better; every term is normalized so the weights are comparable."""
+    weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    horizon, step = metrics['horizon'], metrics['step']
+    return (weights['iae'] * metrics['iae'] / (step * horizon)
+            + weights['overshoot'] * metrics['overshoot'] / step
+            + weights['settling'] * metrics['settling'] / horizon
+            + weights['switching'] * metrics['switching'])
+
+def sweep(model, dt=10.0, step=2.0, candidates=3200, weights=None):
+    """Scores the candidate grid against the model and returns the best coefficients with their metrics."""
+    p, i, d = candidateGrid(model, candidates)
+    metrics = simulate(model, p, i, d, dt=dt, step=step)
+    scores = score(metrics, weights)
+    best = int(np.argmin(scores))
+    return {
+        'p': float(p[best]), 'i': float(i[best]), 'd': float(d[best]),
+        'score': float(scores[best]),
+        'overshoot': float(metrics['overshoot'][best]),
+        'settlingTime': float(metrics['settling'][best]),
+        'switching': float(metrics['switching'][best]),
+        'step': metrics['step'],
+        'candidates': len(p),
+    }
+
+def tune(times, temps, powers, dt=10.0, step=2.0, candidates=3200, weights=None):
+    """Identifies the process from history and recommends PIDLogic coefficients."""
+    started = time.perf_counter()
+    model = identify(times, temps, powers, dt)
+    result = sweep(model, dt=dt, step=step, candidates=candidates, weights=weights)
+    return {'model': model.asDict(), 'recommended': {k: result.pop(k) for k in ('p', 'i', 'd')},
+            'result': result, 'elapsed': time.perf_counter() - started}
+
+def loadHistory(source):
+    """Reads (times, temperatures, powers) from a datahistory JSON file or URL, or a time,temperature,power CSV."""
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            data = json.load(response)
+    elif source.endswith('.csv'):
+        with open(source, newline='') as f:
+            rows = [row for row in csv.DictReader(f)]
+        data = {'label': [float(row['time']) for row in rows],
+                'temperature': [float(row['temperature']) for row in rows],
+                'power': [float(row['power']) for row in rows]}
+    else:
+        with open(source) as f:
+            data = json.load(f)
+    clean = lambda values: [np.nan if v is None else float(v) for v in values]
+    return clean(data['label']), clean(data['temperature']), clean(data['power'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recommend PIDLogic coefficients from controller history")
+    parser.add_argument('source', help="datahistory JSON file or URL, or CSV with time,temperature,power")
+    parser.add_argument('--sample', type=float, default=10.0, help="controller sample time in seconds")
+    parser.add_argument('--step', type=float, default=2.0, help="setpoint change to tune for, in degrees")
+    parser.add_argument('--candidates', type=int, default=3200, help="approximate number of candidates to simulate")
+    args = parser.parse_args(argv)
+
+    result = tune(*loadHistory(args.source), dt=args.sample, step=args.step, candidates=args.candidates)
+    model, recommended = result['model'], result['recommended']
+    print(f"Model: gain {model['gain']:.4f} deg/%, time constant {model['timeConstant'] / 60:.1f} min, "
+          f"dead time {model['deadTime'] / 60:.1f} min, ambient {model['ambient']:.1f}, rmse {model['rmse']:.3f}")
+    print(f"Identified and simulated {result['result']['candidates']} candidates in {result['elapsed']:.2f} s")
+    print(f"Overshoot {result['result']['overshoot']:.2f}, settling {result['result']['settlingTime'] / 60:.0f} min "
+          f"for a {result['result']['step']:.1f} degree step")
+    print("logicCoeffs:")
+    for key in ('p', 'i', 'd'):
+        print(f"  {key}: {recommended[key]:.4g}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# filename: clock.py
+
+import asyncio
+import datetime
+import logging
+import selectors
+import time as _time
+
+logger = logging.getLogger(__name__)
+
+class WallClock:
+    """Clock backed by the system time."""
+
+    def time(self):
+        return _time.time()
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.time())
+
+    async def sleep(self, delay):
+        await asyncio.sleep(delay)
+
+class VirtualClock(WallClock):
+    """Clock following the virtual time of a VirtualTimeEventLoop.
+
+    Wall clock time is frozen at creation (or at startTime) and advances only
+    as fast as the event loop jumps from one scheduled timer to the next.
+    """
+
+    def __init__(self, loop, startTime=None):
+        self.loop = loop
+        self.epoch = startTime if startTime is not None else _time.time()
+
+    def time(self):
+        return self.epoch + self.loop.time()
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """Selector that polls instead of waiting and advances the loop's virtual time by the timeout."""
+
+    loop = None
+
+    def select(self, timeout=None):
+        if timeout is None or timeout <= 0:
+            return super().select(timeout)
+        events = super().select(0)
+        if not events:
+            self.loop._virtualTime += timeout
+        return events
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time jumps straight to the next timer when there is nothing else to do.
+
+    Real I/O (web UI, network actors) is still serviced, but sleeps return
+    immediately, so days of controller operation run in seconds.
+    """
+
+    def __init__(self):
+        selector = _VirtualTimeSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self._virtualTime = 0.0
+
+    def time(self):
+        return self._virtualTime
+
+_clock = WallClock()
+
+def install(settings=None):
+    """Installs the clock and event loop selected by the 'clock' section of config.yaml."""
+    global _clock
+    settings = settings or {}
+    if settings.get('mode', 'wall') == 'virtual':
+        loop = VirtualTimeEventLoop()
+        _clock = VirtualClock(loop, settings.get('startTime'))
+        logger.warning("Running on a virtual clock")
+    else:
+        loop = asyncio.new_event_loop()
+        _clock = WallClock()
+    asyncio.set_event_loop(loop)
+    return loop
+
+def use(clock):
+    global _clock
+    _clock = clock
+
+def get():
+    return _clock
+
+def time():
+    return _clock.time()
+
+def now():
+    return _clock.now()
+
+async def sleep(delay):
+    await _clock.sleep(delay)
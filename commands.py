@@ -0,0 +1,116 @@
+# filename: commands.py
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Allows rate messages per second on average with bursts of up to burst."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.last = asyncio.get_event_loop().time()
+
+    def take(self):
+        now = asyncio.get_event_loop().time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def wait(self):
+        """Seconds until take() succeeds again, as of the last take()."""
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+class CommandPipeline:
+    """Inbound commands for one controller.
+
+    Messages arriving within window seconds of the first pending one are
+    merged, the latest value per key winning, and applied together in one
+    loop turn with a single broadcast, so the keys of one message are never
+    applied separately. Each session is rate limited: messages over its rate
+    are held back, again the latest value per key winning, and submitted
+    once the session has a token again. Every contributing
+    session gets the resulting details with the new state version and the
+    keys that were applied.
+    """
+
+    def __init__(self, controller, window=0.1, rate=10, burst=20):
+        self.controller = controller
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self.pending = {}
+        self.sessions = {}
+        self.held = {}
+        self.releaseHandles = {}
+        self.waiting = []
+        self.flushHandle = None
+        self.stats = {'messages': 0, 'coalesced': 0, 'limited': 0, 'batches': 0}
+
+    def submit(self, message, session=None):
+        """Queues a {endpoint: value} message; returns False if the session is over its rate and it is held back."""
+        self.stats['messages'] += 1
+        if session is not None:
+            key = getattr(session, 'id', id(session))
+            bucket = self.sessions.setdefault(key, TokenBucket(self.rate, self.burst))
+            if key in self.held or not bucket.take():
+                self.hold(key, session, bucket, message)
+                return False
+        self.enqueue(message, session)
+        return True
+
+    def hold(self, key, session, bucket, message):
+        self.stats['limited'] += 1
+        held = self.held.setdefault(key, {})
+        self.stats['coalesced'] += len(held.keys() & message.keys())
+        held.update(message)
+        if key not in self.releaseHandles:
+            logger.debug(f"{self.controller.name}: session {key} over its rate, holding commands back")
+            self.releaseHandles[key] = asyncio.get_event_loop().call_later(bucket.wait(), self.release, key, session, bucket)
+
+    def release(self, key, session, bucket):
+        self.releaseHandles.pop(key, None)
+        if not bucket.take():
+            self.releaseHandles[key] = asyncio.get_event_loop().call_later(bucket.wait(), self.release, key, session, bucket)
+            return
+        self.enqueue(self.held.pop(key), session)
+
+    def enqueue(self, message, session=None):
+        if session is not None and session not in self.waiting:
+            self.waiting.append(session)
+        self.stats['coalesced'] += len(self.pending.keys() & message.keys())
+        self.pending.update(message)
+        if self.flushHandle is None:
+            self.flushHandle = asyncio.get_event_loop().call_later(self.window, self.flush)
+        return True
+
+    def forget(self, session):
+        # Commands held back for the session are still applied when its turn comes
+        self.sessions.pop(getattr(session, 'id', id(session)), None)
+
+    def stop(self):
+        for handle in [self.flushHandle, *self.releaseHandles.values()]:
+            if handle is not None:
+                handle.cancel()
+        self.flushHandle = None
+        self.releaseHandles = {}
+
+    def flush(self):
+        self.flushHandle = None
+        commands, self.pending = self.pending, {}
+        sessions, self.waiting = self.waiting, []
+        self.stats['batches'] += 1
+        version, applied = self.controller.applyCommands(commands)
+        details = self.controller.getDetails()
+        details.update(version=version, ack=applied)
+        for session in sessions:
+            try:
+                session.send(details)
+            except Exception as e:
+                logger.debug(f"{self.controller.name}: cannot acknowledge to session: {e}")
@@ -8,5 +8,26 @@ components = {}
 loop = asyncio.get_event_loop()
 app = web.Application(loop=loop)
 
-__all__ = ['app', 'loop']
+# Routes of components, served through one catch-all route so that they can
+# still be added and removed after the router is frozen (config reload)
+routes = {}
+owners = {}
 
+def addRoute(method, path, handler, owner=None):
+    routes[(method.upper(), path)] = handler
+    if owner is not None:
+        owners.setdefault(owner, []).append((method.upper(), path))
+
+def removeRoutes(owner):
+    for key in owners.pop(owner, []):
+        routes.pop(key, None)
+
+async def dispatchRoute(request):
+    handler = routes.get((request.method, request.path))
+    if handler is None:
+        if any(path == request.path for _, path in routes):
+            raise web.HTTPMethodNotAllowed(request.method, [m for m, path in routes if path == request.path])
+        raise web.HTTPNotFound()
+    return await handler(request)
+
+__all__ = ['app', 'loop', 'addRoute', 'removeRoutes']
@@ -1,8 +1,11 @@
 # filename: controller.py
 
-import json
 import asyncio
+import bisect
+import csv
+import datetime
 import decimal
+import io
 import json
 import logging
 import os
@@ -10,11 +13,15 @@ import sockjs
 import subprocess
 import sys
 from aiohttp import web
-from datetime import datetime
-from time import time
 
+import analytics
+import clock
+import commands
 import event
 import interfaces
+import profiles
+import resilience
+import scheduler
 import syscontroller
 from common import app, components
 
@@ -22,8 +29,69 @@ logger = logging.getLogger(__name__)
 
 HISTORY_SIZE = 1440
 
+class History:
+    """Controller history as parallel series, keyed as in the datahistory response.
+
+    Once size samples are kept, each new one drops the sample whose
+    neighbours are closest in time, so old history thins out instead of
+    disappearing.
+    """
+
+    fields = ['label', 'temperature', 'power', 'setpoint', 'w1temperature', 'gravity', 'abv', 'atten', 'ograv',
+              'gravityRate', 'gravityEta']
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self.series = {field: [] for field in self.fields}
+
+    def __getitem__(self, field):
+        return self.series[field]
+
+    def __len__(self):
+        return len(self.series['label'])
+
+    def append(self, **values):
+        """Adds a sample and returns it as a dict of all fields."""
+        row = {field: values.get(field) for field in self.fields}
+        for field, series in self.series.items():
+            series.append(row[field])
+        if len(self) > self.size:
+            i = Controller.mostredundanttime(self.series['label'])
+            for series in self.series.values():
+                del series[i]
+        return row
+
+    def asDict(self):
+        return {field: [float(v) if isinstance(v, decimal.Decimal) else v for v in series]
+                for field, series in self.series.items()}
+
+    def chunks(self, start=None, stop=None, fields=None, size=500):
+        """Yields the samples with start <= label <= stop as lists of at most size tuples.
+
+        Each chunk is located by bisecting the labels after the last one
+        returned, so samples appended or thinned out between chunks neither
+        repeat nor shift the export.
+        """
+        fields = fields or self.fields
+        labels = self.series['label']
+        i = 0 if start is None else bisect.bisect_left(labels, start)
+        while True:
+            end = len(labels) if stop is None else bisect.bisect_right(labels, stop)
+            end = min(end, i + size)
+            if i >= end:
+                return
+            columns = [self.series[field][i:end] for field in fields]
+            last = labels[end - 1]
+            yield [tuple(float(v) if isinstance(v, decimal.Decimal) else v for v in row) for row in zip(*columns)]
+            i = bisect.bisect_right(labels, last)
+
 class Controller(interfaces.Component, interfaces.Runnable):
-    def __init__(self, name, sensor, actor, logic, targetTemp=0.0, initiallyEnabled=False):
+    # Order in which the keys of one command batch are applied
+    commandOrder = ['state', 'enabled', 'automatic', 'profile', 'setpoint', 'power']
+
+    def __init__(self, name, sensor, actor, logic, targetTemp=0.0, initiallyEnabled=False,
+                 controlMode='poll', pollInterval=10, minInterval=2, watchdogInterval=60, profile=None,
+                 analyticsSettings=None):
         self.w1sensor = components.get('Onewire')
         self.name = name
         self._enabled = initiallyEnabled
@@ -32,24 +100,79 @@ class Controller(interfaces.Component, interfaces.Runnable):
         self.actor = actor
         self.targetTemp = targetTemp
         self.logic = logic
-        self.timestamp_history = []
-        self.power_history = []
-        self.temp_history = []
-        self.setpoint_history = []
-        self.w1temp_history = []
-        self.gravity_history = []
-        self.abv_history = []
-        self.atten_history = []
-        self.ograv_history = []
-        sockjs.add_endpoint(app, prefix=f'/controllers/{self.name}/ws', name=f'{self.name}-ws', handler=self.websocket_handler)
-        asyncio.ensure_future(self.run())
+        self.history = History()
+        self.analytics = analytics.FermentationAnalytics(self.name, sensor, **(analyticsSettings or {}))
+        self.controlMode = controlMode
+        self.pollInterval = pollInterval
+        self.minInterval = minInterval
+        self.watchdogInterval = watchdogInterval
+        self.lastTick = float('-inf')
+        self.pendingReading = None
+        self.readingHandle = None
+        self.profileRun = None
+        self.stateVersion = 0
+        self.commands = commands.CommandPipeline(self)
+        if self.name != "System":
+            try:
+                self.profileRun = profiles.resume(self.name, profile, self.targetTemp)
+            except ValueError as e:
+                logger.error(f"{self.name}: {e}")
+            self.followProfile()
+        if self.sensor is not None:
+            event.register(f'{self.sensor.name}.gravity', self.onGravity, owner=self)
+        if self.controlMode == 'event' and self.sensor is not None:
+            event.register(f'{self.sensor.name}.temperature', self.onReading, owner=self)
+        addWebsocket(self.name)
+        # The System controller has no sensor or actor and nothing to run
+        if self.name != "System":
+            if self.controlMode == 'event':
+                scheduler.every(self.watchdogInterval / 4, self.watchdog, name=f'{self.name}.watchdog', phase=5, owner=self)
+            else:
+                scheduler.every(self.pollInterval, self.tick, name=f'{self.name}.tick', phase=5, priority=10, owner=self)
 
         event.notify(event.Event(source=self.name, endpoint='initialSetpoint', data=self.targetTemp))
         event.notify(event.Event(source=self.name, endpoint='enabled', data=self._enabled))
         event.notify(event.Event(source=self.name, endpoint='automatic', data=self._autoMode))
 
+    def stop(self):
+        if self.readingHandle is not None:
+            self.readingHandle.cancel()
+            self.readingHandle = None
+        self.commands.stop()
+
+    def adoptState(self, previous):
+        """Takes over history, analytics and operator settings from the controller this one replaces on a reload."""
+        self.history = previous.history
+        if self.sensor is previous.sensor:
+            self.analytics.adopt(previous.analytics)
+        self._enabled = previous._enabled
+        self._autoMode = previous._autoMode
+        if self.profileRun is None:
+            self.targetTemp = previous.targetTemp
+        self.stateVersion = previous.stateVersion
+        self.lastTick = previous.lastTick
+        if type(self.logic) is type(previous.logic):
+            self.logic.setState(previous.logic.getState())
+        self.broadcastDetails()
+
+    def getState(self):
+        """Returns setpoint, modes, manual power and logic state for a warm restart."""
+        return {'setpoint': self.targetTemp, 'enabled': bool(self._enabled), 'automatic': bool(self._autoMode),
+                'power': None if self._autoMode else self.actor.getPower(), 'logic': self.logic.getState()}
+
+    def setState(self, state, logicState=True):
+        """Restores what getState() returned, so control resumes where it left off."""
+        if self.profileRun is None and state.get('setpoint') is not None:
+            self.setSetpoint(float(state['setpoint']))
+        self.enabled = bool(state.get('enabled', self._enabled))
+        self.automatic = bool(state.get('automatic', self._autoMode))
+        if self._enabled and not self._autoMode and state.get('power') is not None:
+            self.actor.updatePower(float(state['power']))
+        if logicState:
+            self.logic.setState(state.get('logic') or {})
+        self.broadcastDetails()
+
     def callback(self, endpoint, data):
-        includeSetpoint = True
         if self.name == "System":
             syscontroller.handle_system_command(endpoint, data, controller_name=self.name)
         elif endpoint in ['state', 'enabled']:
@@ -63,8 +186,15 @@ class Controller(interfaces.Component, interfaces.Runnable):
             mode_text = "AUTOMATIC" if self._autoMode else "MANUAL"
             logger.info(f"Setting controller {self.name} to {mode_text}")
         elif endpoint == 'setpoint':
+            if self.profileRun is not None:
+                logger.info(f"{self.name}: manual setpoint overrides profile {self.profileRun.profile.name}")
+                self.stopProfile()
             self.setSetpoint(float(data))
-            includeSetpoint = True
+        elif endpoint == 'profile':
+            if data:
+                self.startProfile(data)
+            else:
+                self.stopProfile()
         elif endpoint == 'power':
             self.actor.updatePower(float(data))
             logger.debug(f"Setting {self.name} controller power to {float(data)}")
@@ -76,7 +206,72 @@ class Controller(interfaces.Component, interfaces.Runnable):
         event.notify(event.Event(source=self.name, endpoint='setpoint', data=self.targetTemp))
         logger.info(f"Setting {self.name} Setpoint to {self.targetTemp}")
 
+    def validateCommand(self, endpoint, value):
+        """Returns the value normalized for callback(), or raises ValueError if the command cannot be applied."""
+        if self.name == 'System':
+            raise ValueError("the System controller is not controlled through batches")
+        if endpoint in ('state', 'enabled', 'automatic'):
+            if value not in (True, False, 0, 1):
+                raise ValueError(f"{endpoint} must be true/false or 1/0")
+            return int(value)
+        if endpoint in ('setpoint', 'power'):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"{endpoint} must be a number")
+            if endpoint == 'power' and not 0 <= value <= 100:
+                raise ValueError("power must be between 0 and 100")
+            return float(value)
+        if endpoint == 'profile':
+            if value and value not in profiles.profiles:
+                raise ValueError(f"unknown profile {value}")
+            return value
+        raise ValueError(f"unknown endpoint {endpoint}")
+
+    def applyCommands(self, batch):
+        """Applies {endpoint: value} commands together and broadcasts once.
+
+        Returns the new state version and the endpoints that were applied.
+        """
+        applied = []
+        position = lambda endpoint: self.commandOrder.index(endpoint) if endpoint in self.commandOrder else len(self.commandOrder)
+        for endpoint in sorted(batch, key=position):
+            try:
+                self.callback(endpoint, batch[endpoint])
+            except (TypeError, ValueError) as e:
+                logger.warning(f"{self.name}: ignoring {endpoint}={batch[endpoint]!r}: {e}")
+                continue
+            applied.append(endpoint)
+        self.stateVersion += 1
+        self.broadcastDetails()
+        event.notify(event.Event(source=self.name, endpoint='version', data=self.stateVersion))
+        return self.stateVersion, applied
+
+    def startProfile(self, name):
+        try:
+            self.profileRun = profiles.start(self.name, name, self.targetTemp)
+        except ValueError as e:
+            logger.warning(f"{self.name}: {e}")
+            return
+        self.followProfile()
+        self.broadcastDetails()
+
+    def stopProfile(self):
+        if self.profileRun is not None:
+            self.profileRun = None
+            profiles.stop(self.name)
+            self.broadcastDetails()
+
+    def followProfile(self):
+        """Moves the setpoint along the running profile."""
+        if self.profileRun is None:
+            return
+        setpoint = round(self.profileRun.setpoint(clock.time()), 1)
+        if setpoint != self.targetTemp:
+            self.targetTemp = setpoint
+            event.notify(event.Event(source=self.name, endpoint='setpoint', data=self.targetTemp))
+
     def broadcastDetails(self, includeSetpoint=True):
+        if self.name not in websockets:
+            return
         manager = sockjs.get_manager(f'{self.name}-ws', app)
         details = self.getDetails()
         if not includeSetpoint:
@@ -113,7 +308,7 @@ class Controller(interfaces.Component, interfaces.Runnable):
             details = {
                 'name': self.name,
                 'temperature': self.sensor.temp(),
-                'w1temperature': self.w1sensor.temp(),
+                'w1temperature': self.w1sensor.temp() if self.w1sensor else None,
                 'gravity': self.sensor.gravity(),
                 'abv': self.sensor.abv(),
                 'atten': self.sensor.atten(),
@@ -122,8 +317,11 @@ class Controller(interfaces.Component, interfaces.Runnable):
                 'automatic': self.automatic,
                 'power': self.actor.getPower(),
                 'setpoint': self.targetTemp,
+                'version': self.stateVersion,
+                'profile': self.profileRun.getDetails(clock.time()) if self.profileRun else None,
                 'wsUrl': f'/controllers/{self.name}/ws'
             }
+            details.update(self.analytics.getDetails())
 
         # Convert Decimal to float for JSON serialization
         for key, value in details.items():
@@ -143,45 +341,60 @@ class Controller(interfaces.Component, interfaces.Runnable):
                 minpos = i
         return minpos
 
-    async def run(self):
-        await asyncio.sleep(5)
-        while True:
-            # Skip actor and sensor logic if the controller is System
-            if self.name != "System":
-                output = self.actor.getPower()
-                if self.enabled:
-                    if self._autoMode:
-                        output = self.logic.calc(self.sensor.temp(), self.targetTemp)
-                    self.actor.updatePower(output)
-    
-                # Update histories for controllers with actors
-                self.timestamp_history.append(time())
-                self.power_history.append(output)
-                self.temp_history.append(self.sensor.temp())
-                self.setpoint_history.append(self.targetTemp)
-                self.w1temp_history.append(self.w1sensor.temp())
-                self.gravity_history.append(self.sensor.gravity())
-                self.abv_history.append(self.sensor.abv())
-                self.atten_history.append(self.sensor.atten())
-                self.ograv_history.append(self.sensor.ograv())
-    
-                # Cull histories if they exceed the size limit
-                if len(self.timestamp_history) == HISTORY_SIZE + 1:
-                    i = self.mostredundanttime(self.timestamp_history)
-                    del self.timestamp_history[i]
-                    del self.power_history[i]
-                    del self.temp_history[i]
-                    del self.setpoint_history[i]
-                    del self.w1temp_history[i]
-                    del self.gravity_history[i]
-                    del self.abv_history[i]
-                    del self.atten_history[i]
-                    del self.ograv_history[i]
-    
-                # Always broadcast details for all controllers, including System
-                self.broadcastDetails()
-    
-            await asyncio.sleep(10)
+    def tick(self, temp=None):
+        """Evaluates the logic, drives the actor, records history and broadcasts details."""
+        if temp is None:
+            temp = self.sensor.temp()
+        self.followProfile()
+        output = self.actor.getPower()
+        if self.enabled:
+            if self._autoMode:
+                output = self.logic.calc(temp, self.targetTemp)
+            self.actor.updatePower(output)
+        self.lastTick = asyncio.get_event_loop().time()
+
+        row = self.history.append(
+            label=clock.time(),
+            temperature=temp,
+            power=output,
+            setpoint=self.targetTemp,
+            w1temperature=self.w1sensor.temp() if self.w1sensor else None,
+            gravity=self.sensor.gravity(),
+            abv=self.sensor.abv(),
+            atten=self.sensor.atten(),
+            ograv=self.sensor.ograv(),
+            **self.analytics.getDetails())
+        event.notify(event.Event(source=self.name, endpoint='history', data=row))
+
+        self.broadcastDetails()
+
+    def onGravity(self, gravity):
+        if gravity is not None:
+            self.analytics.update(clock.time(), gravity)
+
+    def onReading(self, temp):
+        """Evaluates the logic on a fresh sensor reading, at most once per minInterval."""
+        self.pendingReading = temp
+        if self.readingHandle is not None:
+            return  # The scheduled evaluation will pick up the latest reading
+        loop = asyncio.get_event_loop()
+        delay = self.lastTick + self.minInterval - loop.time()
+        if delay <= 0:
+            self.evaluateReading()
+        else:
+            self.readingHandle = loop.call_later(delay, self.evaluateReading)
+
+    def evaluateReading(self):
+        self.readingHandle = None
+        temp, self.pendingReading = self.pendingReading, None
+        self.tick(float(temp))
+
+    def watchdog(self):
+        """Event mode: keeps control and history going when the sensor goes quiet."""
+        quiet = asyncio.get_event_loop().time() - self.lastTick
+        if quiet >= self.watchdogInterval:
+            logger.debug(f"{self.name}: no reading for {quiet:.0f} s, evaluating anyway")
+            self.tick()
 
 
     async def websocket_handler(self, session, msg, additional_argument=None, *args):
@@ -191,21 +404,42 @@ class Controller(interfaces.Component, interfaces.Runnable):
             logger.error(f"Error inspecting session object: {e}")
             session_info = "unknown"
 
+        # sockjs calls handler(manager, session, message), so msg is the client session here
         if isinstance(additional_argument, sockjs.protocol.SockjsMessage):
             if additional_argument.type == sockjs.protocol.MsgType.OPEN:
                 self.broadcastDetails()
             elif additional_argument.type == sockjs.protocol.MsgType.MESSAGE:
                 try:
                     data = json.loads(additional_argument.data)
-                    for endpoint, value in data.items():
-                        self.callback(endpoint, value)
                 except json.JSONDecodeError as e:
                     logger.error(f"Failed to decode WebSocket message: session={session}, controller={self.name}, error={e}, raw_data={additional_argument.data}")
+                    return
+                if isinstance(data, dict):
+                    self.commands.submit(data, msg)
+            elif additional_argument.type == sockjs.protocol.MsgType.CLOSED:
+                self.commands.forget(msg)
+
+websockets = set()
+
+def addWebsocket(name):
+    """Adds the SockJS endpoint of a controller; it always reaches the controller currently named name."""
+    if name in websockets:
+        return
+    async def handler(*args):
+        if name in components:
+            return await components[name].websocket_handler(*args)
+    try:
+        sockjs.add_endpoint(app, prefix=f'/controllers/{name}/ws', name=f'{name}-ws', handler=handler)
+    except RuntimeError:
+        # Controllers added by a reload come after the router is frozen
+        logger.warning(f"{name}: websocket endpoint is available after a restart")
+        return
+    websockets.add(name)
 
 # Create a SystemController class extending Controller
 class SystemController(Controller):
     def __init__(self, name="System"):
-        current_time = datetime.fromtimestamp(time()).strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
+        current_time = clock.now().strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
         super().__init__(name, sensor=None, actor=None, logic=None)
         
         # Register WebSocket route only if not already registered
@@ -213,7 +447,7 @@ class SystemController(Controller):
         if not any(route for route in existing_routes if f'/controllers/{self.name}/ws' in str(route.resource)):
             sockjs.add_endpoint(app, prefix=f'/controllers/{self.name}/ws', name=f'{self.name}-ws', handler=self.websocket_handler)
         else:
-            current_time = datetime.fromtimestamp(time()).strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
+            current_time = clock.now().strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
         
         # Broadcast details on initialization
         self.broadcastDetails()
@@ -271,23 +505,129 @@ async def controllerDetail(request):
 async def dataHistory(request):
     try:
         controllerName = request.match_info['name']
-        controller = components[controllerName]
-        data = {
-            'label': list(controller.timestamp_history),
-            'temperature': [float(temp) if isinstance(temp, decimal.Decimal) else temp for temp in controller.temp_history],
-            'power': [float(power) if isinstance(power, decimal.Decimal) else power for power in controller.power_history],
-            'setpoint': [float(setpoint) if isinstance(setpoint, decimal.Decimal) else setpoint for setpoint in controller.setpoint_history],
-            'w1temperature': [float(temp) if isinstance(temp, decimal.Decimal) else temp for temp in controller.w1temp_history],
-            'gravity': [float(gravity) if isinstance(gravity, decimal.Decimal) else gravity for gravity in controller.gravity_history],
-            'abv': [float(abv) if isinstance(abv, decimal.Decimal) else abv for abv in controller.abv_history],
-            'atten': [float(atten) if isinstance(atten, decimal.Decimal) else atten for atten in controller.atten_history],
-            'ograv': [float(ograv) if isinstance(ograv, decimal.Decimal) else ograv for ograv in controller.ograv_history]
-        }
-        return web.json_response(data)
+        return web.json_response(components[controllerName].history.asDict())
     except KeyError as e:
         raise web.HTTPNotFound(reason=f'Unknown controller {str(e)}')
 
+def parseTime(value):
+    """Epoch seconds or an ISO 8601 date/time (local time unless it has an offset)."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+async def exportHistory(request):
+    """GET /controllers/{name}/export?format=csv|ndjson[&from=..][&to=..][&fields=label,temperature,..]
+
+    Streams the history in chunks, so memory use does not depend on how
+    many samples are exported.
+    """
+    controller = components.get(request.match_info['name'])
+    if not isinstance(controller, Controller):
+        raise web.HTTPNotFound(reason=f"Unknown controller {request.match_info['name']}")
+    kind = request.query.get('format', 'csv')
+    if kind not in ('csv', 'ndjson'):
+        raise web.HTTPBadRequest(reason='format must be csv or ndjson')
+    fields = [field for field in request.query.get('fields', '').split(',') if field] or History.fields
+    unknown = set(fields) - set(History.fields)
+    if unknown:
+        raise web.HTTPBadRequest(reason=f"Unknown fields {', '.join(sorted(unknown))}")
+    try:
+        start = parseTime(request.query['from']) if 'from' in request.query else None
+        stop = parseTime(request.query['to']) if 'to' in request.query else None
+    except ValueError:
+        raise web.HTTPBadRequest(reason='from and to must be epoch seconds or ISO 8601 times')
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/csv; charset=utf-8' if kind == 'csv' else 'application/x-ndjson',
+        'Content-Disposition': f'attachment; filename="{controller.name}-history.{kind}"'})
+    response.enable_compression()
+    await response.prepare(request)
+    if kind == 'csv':
+        await response.write((','.join(fields) + '\r\n').encode('utf-8'))
+    for chunk in controller.history.chunks(start, stop, fields):
+        buffer = io.StringIO()
+        if kind == 'csv':
+            csv.writer(buffer).writerows(chunk)
+        else:
+            for row in chunk:
+                buffer.write(json.dumps(dict(zip(fields, row))))
+                buffer.write('\n')
+        await response.write(buffer.getvalue().encode('utf-8'))
+    await response.write_eof()
+    return response
+
+async def autotuneController(request):
+    controller = components.get(request.match_info['name'])
+    if not isinstance(controller, Controller):
+        raise web.HTTPNotFound(reason=f"Unknown controller {request.match_info['name']}")
+    # NumPy is only loaded when a tuning is asked for; the sweep runs on its own thread
+    import autotune
+    clean = lambda values: [float('nan') if v is None else float(v) for v in values]
+    try:
+        step = float(request.query.get('step', 2.0))
+        result = await interfaces.offloadPool('autotune', workers=1).run(
+            autotune.tune, clean(controller.history['label']), clean(controller.history['temperature']),
+            clean(controller.history['power']), float(controller.pollInterval), step, timeout=120)
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason=str(e))
+    except asyncio.TimeoutError:
+        raise web.HTTPGatewayTimeout(reason='Auto-tuning took too long')
+    return web.json_response(result)
+
+async def batchControl(request):
+    """POST /controllers/batch with [{"controller": ..., "endpoint": ..., "value": ...}, ...]
+
+    Every operation is validated before any is applied; then all are
+    applied in one loop turn, each controller broadcasting once, and the
+    resulting details are returned. Later operations on the same
+    controller and endpoint win.
+    """
+    try:
+        operations = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(reason='Body must be a JSON list of operations')
+    if not isinstance(operations, list):
+        raise web.HTTPBadRequest(reason='Body must be a JSON list of operations')
+
+    batches = {}
+    errors = []
+    for i, operation in enumerate(operations):
+        try:
+            name, endpoint, value = operation['controller'], operation['endpoint'], operation['value']
+            controller = components.get(name)
+            if not isinstance(controller, Controller):
+                raise ValueError(f"unknown controller {name}")
+            batches.setdefault(name, {})[endpoint] = controller.validateCommand(endpoint, value)
+        except (KeyError, TypeError):
+            errors.append({'operation': i, 'error': 'needs controller, endpoint and value'})
+        except ValueError as e:
+            errors.append({'operation': i, 'error': str(e)})
+    if errors:
+        return web.json_response({'errors': errors}, status=400)
+
+    results = {}
+    for name, batch in batches.items():
+        components[name].applyCommands(batch)
+        results[name] = components[name].getDetails()
+    return web.json_response(results)
+
+async def offloadStats(request):
+    return web.json_response(interfaces.offloadStats())
+
+async def healthStates(request):
+    return web.json_response(resilience.health())
+
+async def schedulerStats(request):
+    return web.json_response(scheduler.scheduler().getStats())
+
 app.router.add_get('/controllers', listControllers)
+app.router.add_post('/controllers/batch', batchControl)
 app.router.add_get('/controllers/{name}', controllerDetail, name='controllerDetail')
 app.router.add_get('/controllers/{name}/datahistory', dataHistory, name='dataHistory')
+app.router.add_get('/controllers/{name}/autotune', autotuneController, name='autotune')
+app.router.add_get('/controllers/{name}/export', exportHistory, name='exportHistory')
+app.router.add_get('/offload', offloadStats)
+app.router.add_get('/health', healthStates)
+app.router.add_get('/scheduler', schedulerStats)
 
@@ -14,12 +14,34 @@ def name(event):
 Event.name = name
 
 observers = {}
+listeners = []
+owned = {}
 
-def register(eventName, callback):
+def register(eventName, callback, owner=None):
+    """Calls callback(data) for every eventName; with an owner, unregisterOwner() removes it again."""
     observers.setdefault(eventName, []).append(callback)
+    if owner is not None:
+        owned.setdefault(owner, []).append((eventName, callback))
+
+def unregister(eventName, callback):
+    callbacks = observers.get(eventName, [])
+    if callback in callbacks:
+        callbacks.remove(callback)
+    if not callbacks:
+        observers.pop(eventName, None)
+
+def unregisterOwner(owner):
+    for eventName, callback in owned.pop(owner, []):
+        unregister(eventName, callback)
+
+def listen(callback):
+    """Registers a callback receiving every notified Event, whatever its name."""
+    listeners.append(callback)
 
 def notify(event):
     logger.debug(f"notify {event}")
+    for listener in listeners:
+        listener(event)
     if event.name() in observers:
         for observer in observers[event.name()]:
             if asyncio.iscoroutinefunction(observer):
@@ -0,0 +1,211 @@
+# filename: hotreload.py
+
+import asyncio
+import importlib
+import logging
+import signal
+import time
+from aiohttp import web
+
+import controller
+import event
+import interfaces
+import middleware
+import profiles
+import scheduler
+import startup
+from common import app, components, removeRoutes
+
+logger = logging.getLogger(__name__)
+
+# Controller settings that only matter when the controller is created
+INITIAL_SETTINGS = {'initialSetpoint', 'initialState', 'profile', 'startupTimeout'}
+LOGIC_SETTINGS = {'plugin', 'logicCoeffs'}
+# Settings used before the components are set up
+RESTART_SETTINGS = ['port', 'enableWebUI', 'assetCache', 'clock', 'logLevel', 'consoleLoglevel', 'startup']
+
+def connect(conn):
+    """Registers a 'Sender.endpoint => Receiver.endpoint' connection."""
+    sendEvent, recvEvent = conn.split('=>')
+    recvComponent, recvType = recvEvent.strip().split('.')
+
+    def forward(data):
+        # The receiver may not be set up yet (concurrent startup) or be rebuilding (reload)
+        receiver = components.get(recvComponent)
+        if receiver is None:
+            logger.debug(f"{conn}: {recvComponent} is not available, dropping {data}")
+            return
+        receiver.callback(recvType, data)
+    event.register(sendEvent.strip(), forward, owner=conn)
+
+def definitions(config, section):
+    return {name: attribs for entry in config.get(section) or [] for name, attribs in entry.items()}
+
+class Reloader:
+    """Applies an edited config.yaml to the running components.
+
+    The new config is compared with the one running, and only what changed
+    is touched: changed or removed sensors, actors and extensions are taken
+    out (their scheduler jobs, event observers, routes and own tasks) and
+    rebuilt, controllers are rebuilt only when their sensor, actor or
+    control settings change, keeping their history and operator settings,
+    and a changed logic only replaces the controller's logic. Connections
+    and profiles are updated in place.
+    """
+
+    def __init__(self, configFile, config, load, steps):
+        self.configFile = configFile
+        self.config = config
+        self.load = load
+        self.steps = dict(steps)
+        self.lock = asyncio.Lock()
+        self.previous = {}
+
+    async def switchOff(self, actor):
+        """Switches an actor that is no longer controlled off, waiting at most the startup timeout for it."""
+        timeout = float((self.config.get('startup') or {}).get('timeout', 10))
+        actor.off()
+        try:
+            await asyncio.wait_for(actor.confirmOff(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Reload: {actor.name} not confirmed off within {timeout:g} s")
+
+    async def retire(self, name):
+        """Takes a component, and whatever it contributed, out of the running system; returns their names."""
+        component = components.pop(name, None)
+        step = self.steps.pop(name, None)
+        if component is None:
+            return set()
+        owners = [component]
+        if isinstance(component, middleware.ActorMiddleware):
+            owners.append(component.actor)
+        for owner in owners:
+            scheduler.scheduler().cancelOwner(owner)
+            event.unregisterOwner(owner)
+            removeRoutes(owner)
+        # Stopping a slow PWM channel leaves the output as it is, so actors are switched off first
+        if isinstance(component, interfaces.Actor):
+            await self.switchOff(component)
+        component.stop()
+        if isinstance(component, middleware.ActorMiddleware):
+            middleware.wrapped.pop(name, None)
+        if isinstance(component, controller.Controller):
+            self.previous[name] = component
+        retired = {name}
+        for contributed in (step.contributed if step else []):
+            retired |= await self.retire(contributed)
+        return retired
+
+    def updateLogic(self, name, attribs):
+        module = importlib.import_module(f'plugins.{attribs["plugin"]}')
+        components[name].logic = module.factory(name, attribs['logicCoeffs'])
+
+    async def reload(self):
+        """Reloads the config file and returns what was changed."""
+        async with self.lock:
+            started = time.monotonic()
+            config = self.load(self.configFile)
+            report = {'added': [], 'removed': [], 'rebuilt': [], 'updated': [], 'nextStart': [], 'restartRequired': []}
+            build = {}
+            changed = set()
+            self.previous = {}
+
+            for section in startup.COMPONENT_TYPES:
+                old, new = definitions(self.config, section), definitions(config, section)
+                for name in old.keys() - new.keys():
+                    changed |= await self.retire(name)
+                    report['removed'].append(name)
+                for name, attribs in new.items():
+                    if old.get(name) == attribs and name in components:
+                        continue
+                    report['rebuilt' if name in components else 'added'].append(name)
+                    changed |= await self.retire(name) | {name}
+                    build.setdefault(section, []).append({name: attribs})
+
+            old, new = definitions(self.config, 'controllers'), definitions(config, 'controllers')
+            for name in old.keys() - new.keys():
+                await self.retire(name)
+                report['removed'].append(name)
+            for name, attribs in new.items():
+                previous = old.get(name)
+                if previous is None or name not in components:
+                    report['added'].append(name)
+                    build.setdefault('controllers', []).append({name: attribs})
+                    continue
+                keys = {key for key in previous.keys() | attribs.keys() if previous.get(key) != attribs.get(key)}
+                if keys - LOGIC_SETTINGS - INITIAL_SETTINGS or {attribs['sensor'], attribs['actor']} & changed:
+                    report['rebuilt'].append(name)
+                    await self.retire(name)
+                    build.setdefault('controllers', []).append({name: attribs})
+                elif keys & LOGIC_SETTINGS:
+                    self.updateLogic(name, attribs)
+                    report['updated'].append(name)
+                elif keys:
+                    report['nextStart'].append(name)
+
+            if build:
+                build.update(startup=config.get('startup'), connections=config.get('connections'))
+                built = await startup.Startup(build, partial=True).run()
+                self.steps.update(built.steps)
+            for name, previous in self.previous.items():
+                if isinstance(components.get(name), controller.Controller):
+                    components[name].adoptState(previous)
+            # Actors of controllers removed, moved to another actor or not rebuilt for want of their sensor
+            driven = {id(c.actor) for c in components.values() if isinstance(c, controller.Controller)}
+            for previous in self.previous.values():
+                if components.get(previous.actor.name) is previous.actor and id(previous.actor) not in driven:
+                    await self.switchOff(previous.actor)
+            if 'Onewire' in changed:
+                for component in components.values():
+                    if isinstance(component, controller.Controller):
+                        component.w1sensor = components.get('Onewire')
+            self.previous = {}
+
+            oldConnections, newConnections = set(self.config.get('connections') or []), set(config.get('connections') or [])
+            for conn in oldConnections - newConnections:
+                event.unregisterOwner(conn)
+            for conn in newConnections - oldConnections:
+                connect(conn)
+            report['connections'] = {'added': sorted(newConnections - oldConnections),
+                                     'removed': sorted(oldConnections - newConnections)}
+
+            if (config.get('profiles'), config.get('profileState')) != (self.config.get('profiles'), self.config.get('profileState')):
+                profiles.configure(config.get('profiles'), config.get('profileState', 'profiles.json'))
+                report['updated'].append('profiles')
+
+            report['restartRequired'] = [key for key in RESTART_SETTINGS if config.get(key) != self.config.get(key)]
+            self.config = config
+            report['time'] = round(time.monotonic() - started, 4)
+            summary = [f"{key} {', '.join(report[key])}" for key in ('added', 'removed', 'rebuilt', 'updated') if report[key]]
+            if report['restartRequired']:
+                summary.append(f"{', '.join(report['restartRequired'])} change at the next restart")
+            logger.warning(f"Reloaded {self.configFile} in {report['time'] * 1000:.1f} ms: {'; '.join(summary) or 'no changes'}")
+            return report
+
+current = None
+
+def setup(configFile, config, load, loop):
+    """Enables reloading configFile on SIGHUP and POST /reload."""
+    global current
+    current = Reloader(configFile, config, load, startup.current.steps if startup.current else {})
+
+    def onSignal():
+        task = asyncio.ensure_future(current.reload())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception() is None
+                               or logger.error(f"Reload failed, keeping the running config: {t.exception()}"))
+    try:
+        loop.add_signal_handler(signal.SIGHUP, onSignal)
+    except (AttributeError, NotImplementedError):
+        pass  # No SIGHUP on Windows
+    return current
+
+async def reloadConfig(request):
+    if current is None:
+        raise web.HTTPServiceUnavailable(reason='Still starting')
+    try:
+        return web.json_response(await current.reload())
+    except Exception as e:
+        logger.error(f"Reload failed, keeping the running config: {e}")
+        return web.json_response({'error': f"{type(e).__name__}: {e}"}, status=400)
+
+app.router.add_post('/reload', reloadConfig)
@@ -1,4 +1,7 @@
+import asyncio
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -7,6 +10,18 @@ class Component:
         logger.debug("Not handled event: %s"%str(data))
         pass
 
+    def stop(self):
+        """Cancels the component's own tasks and timers when it is taken out, e.g. on a config reload.
+
+        Scheduler jobs, event observers and routes registered with the
+        component as owner are removed for it.
+        """
+        pass
+
+    async def shutdown(self):
+        """Finishes outbound work and stops the component when tfdeux exits; by default just stop()."""
+        self.stop()
+
 class Runnable:
     def run(self, app):
         pass
@@ -15,6 +30,120 @@ class Measurable:
     def getMeasurements(self):
         pass
 
+class OffloadPool:
+    """Named, bounded thread pool for blocking plugin I/O.
+
+    Calls sharing a key (usually a device) run one at a time, so a hung
+    device occupies at most one worker while the others keep going. The
+    timeout covers waiting for the key, the queue and the call itself; a
+    call that times out keeps its key until the thread really returns.
+    """
+
+    def __init__(self, name, workers=2):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"offload-{name}")
+        self.locks = {}
+        self.stats = {'calls': 0, 'errors': 0, 'timeouts': 0, 'cancelled': 0, 'inFlight': 0,
+                      'queueWaitTotal': 0.0, 'queueWaitMax': 0.0, 'callTimeTotal': 0.0, 'callTimeMax': 0.0}
+
+    @staticmethod
+    def _timed(timing, fn, args):
+        timing.append(time.monotonic())
+        try:
+            return fn(*args)
+        finally:
+            timing.append(time.monotonic())
+
+    def _record(self, timing):
+        if len(timing) < 3:
+            return  # Cancelled before a worker picked it up
+        submitted, started, finished = timing
+        self.stats['queueWaitTotal'] += started - submitted
+        self.stats['queueWaitMax'] = max(self.stats['queueWaitMax'], started - submitted)
+        self.stats['callTimeTotal'] += finished - started
+        self.stats['callTimeMax'] = max(self.stats['callTimeMax'], finished - started)
+
+    async def _call(self, fn, args, key):
+        lock = None
+        if key is not None:
+            lock = self.locks.setdefault(key, asyncio.Lock())
+            await lock.acquire()
+        self.stats['calls'] += 1
+        self.stats['inFlight'] += 1
+        timing = [time.monotonic()]
+        submitted = self.executor.submit(self._timed, timing, fn, args)
+        future = asyncio.wrap_future(submitted)
+
+        def done(f):
+            self.stats['inFlight'] -= 1
+            self._record(timing)
+            if lock is not None:
+                lock.release()
+        future.add_done_callback(done)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Drop the call if no worker picked it up yet; a running call finishes in the background
+            submitted.cancel()
+            raise
+
+    async def run(self, fn, *args, key=None, timeout=None):
+        """Runs fn(*args) on the pool and returns its result."""
+        try:
+            return await asyncio.wait_for(self._call(fn, args, key), timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            logger.warning(f"Offload {self.name}: {getattr(fn, '__qualname__', fn)} ({key}) timed out after {timeout} s")
+            raise
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            raise
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+
+    def getStats(self):
+        stats = dict(self.stats, workers=self.workers)
+        calls = max(stats['calls'], 1)
+        stats['queueWaitAvg'] = stats['queueWaitTotal'] / calls
+        stats['callTimeAvg'] = stats['callTimeTotal'] / calls
+        return stats
+
+    async def drain(self):
+        """Returns once no call is in flight any more."""
+        while self.stats['inFlight']:
+            await asyncio.sleep(0.05)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+offloadPools = {}
+
+def offloadPool(name, workers=2):
+    """Returns the named pool, creating it with the given number of workers on first use."""
+    if name not in offloadPools:
+        offloadPools[name] = OffloadPool(name, workers)
+    return offloadPools[name]
+
+def offloadStats():
+    return {name: pool.getStats() for name, pool in offloadPools.items()}
+
+class Offloaded:
+    """Mixin for plugins doing blocking I/O; declare the pool and call self.offload(fn, *args).
+
+    Calls are serialized per component (by its name) unless another key is given.
+    """
+    offloadPoolName = 'default'
+    offloadWorkers = 2
+    offloadTimeout = 10.0
+
+    async def offload(self, fn, *args, key=None, timeout=None):
+        pool = offloadPool(self.offloadPoolName, self.offloadWorkers)
+        return await pool.run(fn, *args,
+                              key=self.name if key is None else key,
+                              timeout=self.offloadTimeout if timeout is None else timeout)
+
 class Sensor(Component, Runnable, Measurable):
 
     async def run(self):
@@ -36,10 +165,21 @@ class Actor(Component, Runnable):
     def off(self):
         pass
 
+    async def confirmOff(self):
+        """Returns once the hardware is known to be off; by default as soon as off() returned."""
+        pass
+
 
 class Logic(Component):
     def calc(self, input, setpoint):
         pass
 
+    def getState(self):
+        """Returns the internal state (JSON types) needed to continue seamlessly after a restart."""
+        return {}
+
+    def setState(self, state):
+        pass
+
 class Controller(Component, Runnable):
     pass
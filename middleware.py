@@ -0,0 +1,151 @@
+# filename: middleware.py
+
+import asyncio
+import logging
+from aiohttp import web
+
+import interfaces
+from common import app
+
+logger = logging.getLogger(__name__)
+
+wrapped = {}
+
+def wrap(actor, settings=None):
+    """Puts an ActorMiddleware in front of an actor unless its config says 'middleware: false'."""
+    if settings is False:
+        return actor
+    middleware = ActorMiddleware(actor, **(settings or {}))
+    wrapped[actor.name] = middleware
+    return middleware
+
+class ActorMiddleware(interfaces.Actor):
+    """Write-through state cache between controllers and an actor.
+
+    Writes equal to the last commanded and confirmed power are dropped,
+    changes arriving within coalesceWindow seconds of the previous write
+    collapse into one trailing write of the latest value, and the current
+    state is re-asserted every reassertInterval seconds without writes.
+    on() and off() always go through.
+    """
+
+    def __init__(self, actor, coalesceWindow=0.0, reassertInterval=0.0):
+        self.actor = actor
+        self.name = actor.name
+        self.coalesceWindow = float(coalesceWindow)
+        self.reassertInterval = float(reassertInterval)
+        self.commanded = None
+        self.pendingPower = None
+        self.lastWrite = float('-inf')
+        self.flushHandle = None
+        self.reassertHandle = None
+        self.stats = {'requests': 0, 'writes': 0, 'dropped': 0, 'coalesced': 0, 'reasserts': 0}
+        self.scheduleReassert()
+
+    def __getattr__(self, attr):
+        return getattr(self.actor, attr)
+
+    def confirmed(self):
+        """Power the actor reports as applied; None when an asynchronous actor has not confirmed yet."""
+        if hasattr(self.actor, 'confirmedPower'):
+            return self.actor.confirmedPower
+        return self.actor.getPower()
+
+    def write(self, power):
+        self.pendingPower = None
+        self.commanded = power
+        self.lastWrite = asyncio.get_event_loop().time()
+        self.stats['writes'] += 1
+        self.actor.updatePower(power)
+        self.scheduleReassert()
+
+    def flush(self):
+        self.flushHandle = None
+        if self.pendingPower is not None:
+            self.write(self.pendingPower)
+
+    def updatePower(self, power):
+        self.stats['requests'] += 1
+        if self.flushHandle is None and power == self.commanded and self.confirmed() == power:
+            self.stats['dropped'] += 1
+            return
+        now = asyncio.get_event_loop().time()
+        if now - self.lastWrite >= self.coalesceWindow:
+            self.write(power)
+            return
+        if self.pendingPower is not None:
+            self.stats['coalesced'] += 1
+        self.pendingPower = power
+        if self.flushHandle is None:
+            self.flushHandle = asyncio.get_event_loop().call_at(self.lastWrite + self.coalesceWindow, self.flush)
+
+    def getPower(self):
+        if self.pendingPower is not None:
+            return self.pendingPower
+        return self.actor.getPower()
+
+    def cancelPending(self):
+        self.pendingPower = None
+        if self.flushHandle is not None:
+            self.flushHandle.cancel()
+            self.flushHandle = None
+
+    def direct(self, command):
+        self.cancelPending()
+        command()
+        self.commanded = self.actor.getPower()
+        self.lastWrite = asyncio.get_event_loop().time()
+        self.stats['writes'] += 1
+        self.scheduleReassert()
+
+    def on(self):
+        self.direct(self.actor.on)
+
+    def off(self):
+        self.direct(self.actor.off)
+
+    async def confirmOff(self):
+        await self.actor.confirmOff()
+
+    def stop(self):
+        for handle in (self.flushHandle, self.reassertHandle):
+            if handle is not None:
+                handle.cancel()
+        self.flushHandle = self.reassertHandle = None
+        self.actor.stop()
+
+    def scheduleReassert(self):
+        if self.reassertInterval <= 0:
+            return
+        if self.reassertHandle is not None:
+            self.reassertHandle.cancel()
+        self.reassertHandle = asyncio.get_event_loop().call_later(self.reassertInterval, self.reassert)
+
+    def reassert(self):
+        """Re-sends the commanded state so hardware that lost it (power cut, manual switch) is corrected."""
+        self.reassertHandle = None
+        if self.commanded is not None:
+            self.stats['reasserts'] += 1
+            if hasattr(self.actor, 'reassert'):
+                self.actor.reassert()
+            else:
+                self.actor.updatePower(self.commanded)
+        self.scheduleReassert()
+
+    def callback(self, endpoint, data):
+        if endpoint == 'power':
+            self.updatePower(data)
+        elif endpoint == 'state' and data == 1:
+            self.on()
+        elif endpoint == 'state' and data == 0:
+            self.off()
+        else:
+            self.actor.callback(endpoint, data)
+
+    def getStats(self):
+        return dict(self.stats, commanded=self.commanded, confirmed=self.confirmed())
+
+async def actorStats(request):
+    return web.json_response({name: middleware.getStats() for name, middleware in wrapped.items()})
+
+app.router.add_get('/actors/stats', actorStats)
@@ -5,6 +5,9 @@ import BlynkLib
 import logging
 
 import interfaces
+import resilience
+import scheduler
+from interfaces import Offloaded
 from event import notify, Event
 
 logger = logging.getLogger(__name__)
@@ -15,15 +18,21 @@ def factory(name, settings):
     component = BlynkComponent(name, blynkServer, blynkPort, settings['token'])
     return component
 
-class BlynkComponent(interfaces.Component):
+class BlynkComponent(interfaces.Component, Offloaded):
+    offloadPoolName = 'blynk'
+    offloadTimeout = 5.0
+
     def __init__(self, name, server, port, token):
         self.name = name
         self.server = server
         self.port = port
         self.token = token
-        self.blynk = BlynkLib.Blynk(self.token, server=self.server)
+        # BlynkLib connects when it is constructed, so it is created by the task, off the loop
+        self.blynk = None
+        self.guard = resilience.guard(self.name, timeout=self.offloadTimeout + 1, maxInFlight=1, resetTimeout=60)
         self.loop = asyncio.get_event_loop()
-        self.loop.create_task(self.blynk_task())
+        self.retryAt = 0.0
+        scheduler.every(0.1, self.blynk_task, name=f'{self.name}.blynk', owner=self)
 
     def convert_bool(self, value, to_blynk=True):
         if to_blynk:
@@ -33,7 +42,8 @@ class BlynkComponent(interfaces.Component):
             # Converting 1/0 from Blynk to True/False
             return True if int(value) == 1 else False
 
-    async def blynk_task(self):
+    def register_handlers(self):
+        # Handlers run on the offload thread inside blynk.run(), so events are handed back to the loop
         @self.blynk.on("V*")
         def blynk_handle_vpins(pin, value):
             pin = int(pin)
@@ -41,24 +51,44 @@ class BlynkComponent(interfaces.Component):
             if 17 <= pin <= 20:
                 # Convert 1/0 from Blynk to True/False
                 converted_value = self.convert_bool(int(value[0]), to_blynk=False)
-                notify(Event(source=self.name, endpoint='v%d'% pin, data=converted_value))
+                self.loop.call_soon_threadsafe(notify, Event(source=self.name, endpoint='v%d'% pin, data=converted_value))
             else:
-                notify(Event(source=self.name, endpoint='v%d'% pin, data=round(float(value[0]), 1)))
+                self.loop.call_soon_threadsafe(notify, Event(source=self.name, endpoint='v%d'% pin, data=round(float(value[0]), 1)))
 
         @self.blynk.on("connected")
         def blynk_connected(ping):
             print("Access granted, happy Blynking!")
             print('Blynk ready. Ping:', ping, 'ms')
 
-        while True:
-            self.blynk.run()
-            await asyncio.sleep(0.1)  # Adjust sleep time as needed
+    def create(self):
+        self.blynk = BlynkLib.Blynk(self.token, server=self.server)
+        self.register_handlers()
+
+    async def blynk_task(self):
+        if self.blynk is None or self.blynk.state == BlynkLib.DISCONNECTED:
+            if self.loop.time() < self.retryAt:
+                return
+            # Connecting blocks on DNS, TCP and TLS, so it goes through the offload pool behind a circuit breaker
+            try:
+                await self.guard.call(self.offload, self.create if self.blynk is None else self.blynk.connect)
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"Blynk {self.name}: cannot connect: {e!r}")
+                self.retryAt = self.loop.time() + 5
+                return
+        # BlynkLib reads its socket synchronously; calls for this component are serialized off the loop
+        try:
+            await self.offload(self.blynk.run)
+        except asyncio.TimeoutError:
+            logger.warning(f"Blynk {self.name}: run timed out")
 
     def callback(self, endpoint, data):
+        if self.blynk is None or self.blynk.state != BlynkLib.CONNECTED:
+            logger.debug(f"Blynk {self.name}: not connected, dropping {endpoint}={data}")
+            return
         pin = int(endpoint[1:])
         if 17 <= pin <= 20:
             # Convert True/False to 1/0 before sending to Blynk
             converted_data = self.convert_bool(data, to_blynk=True)
-            self.blynk.virtual_write(pin, converted_data)
+            asyncio.ensure_future(self.offload(self.blynk.virtual_write, pin, converted_data))
         else:
-            self.blynk.virtual_write(pin, data)
+            asyncio.ensure_future(self.offload(self.blynk.virtual_write, pin, data))
@@ -1,8 +1,9 @@
 # filename: DummySensor.py
 
-import asyncio
 from random import normalvariate
 
+import clock
+import scheduler
 from event import notify, Event
 from interfaces import Sensor
 
@@ -32,20 +33,18 @@ class DummySensor(Sensor):
         self.lastTemp = 0
         self.lastGravity = 0
         self.name = name
-        asyncio.get_event_loop().create_task(self.run())
+        scheduler.every(10, self.poll, name=f'{self.name}.poll', owner=self)
 
-    async def run(self):
-        while True:
-            if self.sensor_type in ['thermo', 'tilt']:
-                self.lastTemp = await self.readTemp()
-            if self.sensor_type in ['hydro', 'tilt']:
-                self.lastGravity = await self.readGravity()
-            await asyncio.sleep(10)
+    async def poll(self):
+        if self.sensor_type in ['thermo', 'tilt']:
+            self.lastTemp = await self.readTemp()
+        if self.sensor_type in ['hydro', 'tilt']:
+            self.lastGravity = await self.readGravity()
 
     async def readTemp(self):
         if self.fakeTemp is None:
             return None
-        await asyncio.sleep(2)
+        await clock.sleep(2)
         temp = round(normalvariate(self.fakeTemp, 2.5), 1)
         notify(Event(source=self.name, endpoint='temperature', data=temp))
         return temp
@@ -53,7 +52,7 @@ class DummySensor(Sensor):
     async def readGravity(self):
         if self.fakeGravity is None:
             return None
-        await asyncio.sleep(2)
+        await clock.sleep(2)
         gravity = round(normalvariate(self.fakeGravity, 0.01), 3)
         notify(Event(source=self.name, endpoint='gravity', data=gravity))
         return gravity
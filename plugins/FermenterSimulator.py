@@ -0,0 +1,184 @@
+# filename: FermenterSimulator.py
+
+import asyncio
+import logging
+import numpy as np
+
+import scheduler
+from common import components
+from event import notify, Event
+from interfaces import Actor, Component, Sensor
+
+logger = logging.getLogger(__name__)
+
+LB_PER_GALLON = 8.34
+
+def factory(name, settings):
+    """Factory function to create a FermenterBank with its simulated sensors and actors."""
+    return FermenterBank(name, settings)
+
+class FermenterBank(Component):
+    """Simulates a bank of fermenters as one vectorized thermal and gravity model.
+
+    Every fermenter has a thermal mass coupled to the ambient air, a cooling
+    and a heating actor whose power feeds the model, and a gravity curve that
+    decays from OG towards FG at a temperature dependent rate. All fermenters
+    are stepped together from a single task.
+    """
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.count = int(settings.get('count', 1))
+        self.step = float(settings.get('step', 10))
+        self.noise = float(settings.get('noise', 0.1))
+        self.controllerTemplate = settings.get('controllers')
+        rng = np.random.default_rng(settings.get('seed'))
+        spread = float(settings.get('spread', 0.0))
+
+        def param(key, default):
+            value = np.full(self.count, float(settings.get(key, default)))
+            if spread:
+                value *= rng.normal(1.0, spread, self.count)
+            return value
+
+        self.rng = rng
+        self.ambient = param('ambient', 65.0)                       # F
+        self.mass = param('volume', 5.0) * LB_PER_GALLON            # BTU/F
+        self.ua = param('ua', 4.0)                                  # BTU/h/F
+        self.coolingPower = param('coolingPower', 400.0)            # BTU/h
+        self.heatingPower = param('heatingPower', 200.0)            # BTU/h
+        self.og = param('og', 1.060)
+        self.fg = param('fg', 1.012)
+        self.rate = param('fermentationRate', 0.03)                 # 1/h at refTemp
+        self.refTemp = float(settings.get('refTemp', 66.0))
+        self.lag = param('lag', 12.0)                               # h
+        self.fermentationHeat = float(settings.get('fermentationHeat', 0.3))  # F rise per gravity point, no losses
+
+        self.temperature = param('initialTemp', 68.0)
+        self.sg = self.og.copy()
+        self.elapsed = 0.0
+        self.cooling = np.zeros(self.count)
+        self.heating = np.zeros(self.count)
+        self.readTemp = self.temperature.copy()
+        self.readGravity = self.sg.copy()
+
+        width = len(str(self.count))
+        self.fermenters = []
+        for i in range(self.count):
+            fermenterName = f"{self.name}{i + 1:0{width}d}"
+            sensor = SimulatedSensor(fermenterName, self, i)
+            components[fermenterName] = sensor
+            components[f"{fermenterName}Cooling"] = SimulatedActor(f"{fermenterName}Cooling", self.cooling, i)
+            components[f"{fermenterName}Heating"] = SimulatedActor(f"{fermenterName}Heating", self.heating, i)
+            self.fermenters.append(sensor)
+        logger.info(f"{self.name}: simulating {self.count} fermenters")
+
+        self.lastStep = asyncio.get_event_loop().time()
+        scheduler.every(self.step, self.tick, name=f'{self.name}.step', owner=self)
+
+    def getControllerConfigs(self):
+        """Returns controller entries, in config.yaml format, for every simulated fermenter."""
+        if not self.controllerTemplate:
+            return []
+        configs = []
+        for sensor in self.fermenters:
+            attribs = dict(self.controllerTemplate)
+            attribs['sensor'] = sensor.name
+            attribs['actor'] = f"{sensor.name}{attribs.get('actor', 'Cooling')}"
+            configs.append({f"{sensor.name}Ctrl": attribs})
+        return configs
+
+    def advance(self, dt):
+        """Advances every fermenter by dt seconds."""
+        hours = dt / 3600.0
+
+        # Gravity decays towards FG once the lag phase is over, faster when warm
+        self.elapsed += hours
+        active = self.elapsed > self.lag
+        rate = self.rate * np.power(2.0, (self.temperature - self.refTemp) / 18.0) * active
+        sgNext = self.fg + (self.sg - self.fg) * np.exp(-rate * hours)
+        heat = (self.sg - sgNext) * 1000.0 * self.mass * self.fermentationHeat / max(hours, 1e-9)
+        self.sg = sgNext
+
+        # Exact solution of the first order thermal model over the step
+        load = self.heatingPower * self.heating - self.coolingPower * self.cooling + heat
+        equilibrium = self.ambient + load / self.ua
+        decay = np.exp(-self.ua / self.mass * hours)
+        self.temperature = equilibrium + (self.temperature - equilibrium) * decay
+
+        self.readTemp = np.round(self.temperature + self.rng.normal(0.0, self.noise, self.count), 1)
+        self.readGravity = np.round(self.sg, 3)
+
+    def tick(self):
+        now = asyncio.get_event_loop().time()
+        self.advance(now - self.lastStep)
+        self.lastStep = now
+        for sensor in self.fermenters:
+            sensor.publish()
+
+class SimulatedSensor(Sensor):
+    """Sensor view onto one fermenter of a FermenterBank."""
+
+    def __init__(self, name, bank, index):
+        self.name = name
+        self.bank = bank
+        self.index = index
+
+    def publish(self):
+        notify(Event(source=self.name, endpoint='temperature', data=self.temp()))
+        notify(Event(source=self.name, endpoint='gravity', data=self.gravity()))
+
+    def temp(self):
+        return float(self.bank.readTemp[self.index])
+
+    def gravity(self):
+        return float(self.bank.readGravity[self.index])
+
+    def ograv(self):
+        return round(float(self.bank.og[self.index]), 4)
+
+    def abv(self):
+        return round((self.ograv() - self.gravity()) * 131.25, 2)
+
+    def atten(self):
+        return round(100.0 * (self.ograv() - self.gravity()) / (self.ograv() - 1.0), 2)
+
+    def callback(self, endpoint, data):
+        if endpoint == 'ambient':
+            self.bank.ambient[self.index] = float(data)
+        else:
+            super().callback(endpoint, data)
+
+class SimulatedActor(Actor):
+    """Actor whose power is fed into one slot of a FermenterBank input array."""
+
+    def __init__(self, name, inputs, index):
+        self.name = name
+        self.inputs = inputs
+        self.index = index
+        self.power = 0
+
+    def updatePower(self, power):
+        self.power = power
+        self.inputs[self.index] = power / 100.0
+        notify(Event(source=self.name, endpoint='power', data=int(self.power)))
+
+    def getPower(self):
+        return self.power
+
+    def on(self):
+        self.updatePower(100)
+
+    def off(self):
+        self.updatePower(0)
+
+    def callback(self, endpoint, data):
+        if endpoint == 'state':
+            if data == 0:
+                self.off()
+            elif data == 1:
+                self.on()
+            else:
+                logger.warning(f"SimulatedActor {self.name}: unsupported data value: {data}")
+        else:
+            super().callback(endpoint, data)
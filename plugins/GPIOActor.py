@@ -1,33 +1,85 @@
 # filename: GPIOActor.py
 
+import asyncio
+import logging
+
+import slowpwm
 from event import notify, Event
-from interfaces import Actor
+from interfaces import Actor, Offloaded
 
 import RPi.GPIO as GPIO
 GPIO.setmode(GPIO.BCM)
 
+logger = logging.getLogger(__name__)
+
 def factory(name, settings):
-    return GPIOActor(name, settings['gpio'], settings.get('pwmFrequency',2))
+    slowPWM = settings if 'cycleTime' in settings else None
+    return GPIOActor(name, settings['gpio'], settings.get('pwmFrequency',2), slowPWM)
 
 
-class GPIOActor(Actor):
-    def __init__(self, name, pin, pwmFrequency):
+class GPIOActor(Actor, Offloaded):
+    offloadPoolName = 'gpio'
+    offloadTimeout = 2.0
+
+    def __init__(self, name, pin, pwmFrequency, slowPWM=None):
         self.name = name
         self.power = 0.0
         self.pin = pin
         self.frequency = pwmFrequency
         GPIO.setup(self.pin, GPIO.OUT)
-        self.p = GPIO.PWM(self.pin, self.frequency)
-        self.p.start(self.power)
+        if slowPWM:
+            # Time-proportioned switching for relays that cannot follow software PWM
+            self.p = None
+            self.pwm = slowpwm.channel(self.name, self.switch,
+                                       cycleTime=slowPWM['cycleTime'],
+                                       minOnTime=slowPWM.get('minOnTime', 0),
+                                       minOffTime=slowPWM.get('minOffTime', 0))
+        else:
+            self.pwm = None
+            self.p = GPIO.PWM(self.pin, self.frequency)
+            self.p.start(self.power)
+
+    async def confirmOff(self):
+        if self.pwm:
+            await self.pwm.switchedOff()
+
+    def stop(self):
+        if self.pwm:
+            self.pwm.close()
+        else:
+            self.p.stop()
+
+    async def switch(self, on):
+        try:
+            await self.offload(GPIO.output, self.pin, GPIO.HIGH if on else GPIO.LOW)
+        except Exception as e:
+            logger.error(f"{self.name}: cannot switch GPIO {self.pin} {'on' if on else 'off'}: {e!r}")
+            return False
+        return True
+
+    async def changeDutyCycle(self, power):
+        try:
+            await self.offload(self.p.ChangeDutyCycle, power)
+        except Exception as e:
+            logger.error(f"{self.name}: cannot set GPIO {self.pin} duty cycle to {power}: {e!r}")
 
     def updatePower(self, power):
         self.power = power
-        self.p.ChangeDutyCycle(self.power)
+        if self.pwm:
+            self.pwm.setPower(self.power)
+        else:
+            asyncio.ensure_future(self.changeDutyCycle(self.power))
         notify(Event(source=self.name, endpoint='power', data=power))
 
     def getPower(self):
         return self.power
 
+    def reassert(self):
+        if self.pwm:
+            self.pwm.reassert()
+        else:
+            self.updatePower(self.power)
+
     def on(self):
         self.updatePower(100.0)
 
@@ -44,6 +44,13 @@ class HysteresisCoolingLogic(interfaces.Logic):
         self.lastOutput = self.output
         return self.output*100.0
 
+    def getState(self):
+        # The hysteresis bands are configuration (logicCoeffs), so an edited config.yaml wins
+        return {'lastOutput': self.lastOutput}
+
+    def setState(self, state):
+        self.lastOutput = self.output = int(state.get('lastOutput', self.lastOutput))
+
     def callback(self, endpoint, data):
         if endpoint == 'undershoot':
             self.hysteresisUnder = round(float(data), 1)
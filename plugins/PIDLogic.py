@@ -7,7 +7,7 @@
 # which is licensed under the MIT license
 #
 
-import time
+import clock
 from interfaces import Logic
 
 
@@ -15,7 +15,7 @@ def factory(name, settings):
     kp = settings['p']
     ki = settings['i']
     kd = settings['d']
-    logic = PIDLogic(10.0, kp, ki, kd, 0, 100)
+    logic = PIDLogic(float(settings.get('sampleTime', 10.0)), kp, ki, kd, 0, 100)
     return logic
 
 class PIDLogic(Logic):
@@ -32,8 +32,9 @@ class PIDLogic(Logic):
             raise ValueError('outputMin must be less than outputMax')
 
         self._Kp = kp
-        self._Ki = sampleTimeSec / ki
-        self._Kd = kd / sampleTimeSec
+        # Integral and derivative gains per second; calc() scales them by the time since the last calculation
+        self._Ki = 1.0 / ki
+        self._Kd = kd
         self._sampleTime = sampleTimeSec * 1000
         self._outputMin = outputMin
         self._outputMax = outputMax
@@ -59,19 +60,22 @@ class PIDLogic(Logic):
             # print("not yet")
             return self._lastOutput
 
+        # Readings may come at another pace than the sample time (event mode); the first calculation assumes it
+        dt = (diff if self._lastCalc else self._sampleTime) / 1000.0
+
         # Compute all the working error variables
         error = setpoint - inputValue
         dInput = inputValue - self._lastInput
 
         # In order to prevent windup, only integrate if the process is not saturated
         if self._lastOutput < self._outputMax and self._lastOutput > self._outputMin:
-            self._iTerm += self._Ki * error
+            self._iTerm += self._Ki * error * dt
             self._iTerm = min(self._iTerm, self._outputMax)
             self._iTerm = max(self._iTerm, self._outputMin)
 
         p = self._Kp * error
         i = self._iTerm
-        d = -(self._Kd * dInput)
+        d = -(self._Kd * dInput / dt)
 
         # Compute PID Output
         self._lastOutput = p + i + d
@@ -83,7 +87,15 @@ class PIDLogic(Logic):
         self._lastCalc = now
         return self._lastOutput
 
+    def getState(self):
+        return {'iTerm': self._iTerm, 'lastInput': self._lastInput, 'lastOutput': self._lastOutput}
+
+    def setState(self, state):
+        self._iTerm = min(max(float(state.get('iTerm', self._iTerm)), self._outputMin), self._outputMax)
+        self._lastInput = float(state.get('lastInput', self._lastInput))
+        self._lastOutput = float(state.get('lastOutput', self._lastOutput))
+
     def _currentTimeMs(self):
-        val = time.time() * 1000
+        val = clock.time() * 1000
         # print("_currentTimeMs: %d"%val)
         return val
@@ -7,8 +7,9 @@ import math
 import spidev
 from time import sleep
 
+import scheduler
 from event import notify, Event
-from interfaces import Sensor
+from interfaces import Offloaded, Sensor
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +22,10 @@ def factory(name, settings):
     r0 = settings.get('zeroDegResistance', 100)
     return RTDSensor(name, bus, device, rref, r0, offset, pollInterval)
 
-class RTDSensor(Sensor):
+class RTDSensor(Sensor, Offloaded):
+    offloadPoolName = 'spi'
+    offloadTimeout = 2.0
+
     def __init__(self, name, bus=0, device=0, rref=430, r0=100, offset=0, pollInterval=0):
         self.name = name
         self.offset = offset
@@ -36,17 +40,15 @@ class RTDSensor(Sensor):
         self.spi.mode = 0b01
         self.spi.max_speed_hz = 500000
 
-        asyncio.get_event_loop().create_task(self.run())
+        scheduler.every(self.pollInterval, self.poll, name=f'{self.name}.poll', owner=self)
 
 
-    async def run(self):
-        while True:
-            try:
-                self.lastTemp = await asyncio.get_event_loop().run_in_executor(None, self.readTemp) + self.offset
-                notify(Event(source=self.name, endpoint='temperature', data=self.lastTemp))
-            except RuntimeError as e:
-                logger.debug(str(e))
-            await asyncio.sleep(self.pollInterval)
+    async def poll(self):
+        try:
+            self.lastTemp = await self.offload(self.readTemp, key=(self.bus, self.device)) + self.offset
+            notify(Event(source=self.name, endpoint='temperature', data=self.lastTemp))
+        except (RuntimeError, asyncio.TimeoutError) as e:
+            logger.debug(f"{self.name}: {e!r}")
 
     def readTemp(self):
         self.spi.xfer([0x80, 0xB3])
@@ -0,0 +1,270 @@
+# filename: RuleEngine.py
+
+import asyncio
+import logging
+from collections import deque
+from aiohttp import web
+
+import event
+import interfaces
+from common import addRoute
+from event import notify, Event
+
+logger = logging.getLogger(__name__)
+
+STATS = ('value', 'mean', 'min', 'max', 'range', 'rate')
+
+def factory(name, settings):
+    """Factory function to create a RuleEngine with the rules from its settings."""
+    return RuleEngine(name, settings.get('rules') or {})
+
+class Window:
+    """Sliding time window over one topic with running min, max, mean and trend.
+
+    Samples leave the window as new ones arrive, so every update is
+    amortized constant time. Min and max use monotonic deques; mean and
+    rate (least-squares slope, per hour) use running sums.
+    """
+
+    def __init__(self, length):
+        self.length = float(length)
+        self.samples = deque()
+        self.minimums = deque()
+        self.maximums = deque()
+        self.first = None
+        self.base = None
+        self.n = 0
+        self.st = self.sv = self.stt = self.stv = 0.0
+
+    def _add(self, t, value, sign):
+        t -= self.base
+        self.n += sign
+        self.st += sign * t
+        self.sv += sign * value
+        self.stt += sign * t * t
+        self.stv += sign * t * value
+
+    def _rebase(self, now):
+        # Keep the running sums well conditioned as time grows
+        self.base = now
+        self.n = 0
+        self.st = self.sv = self.stt = self.stv = 0.0
+        for t, value in self.samples:
+            self._add(t, value, 1)
+
+    def add(self, now, value):
+        if self.first is None:
+            self.first = self.base = now
+        self.samples.append((now, value))
+        self._add(now, value, 1)
+        while self.minimums and self.minimums[-1][1] >= value:
+            self.minimums.pop()
+        self.minimums.append((now, value))
+        while self.maximums and self.maximums[-1][1] <= value:
+            self.maximums.pop()
+        self.maximums.append((now, value))
+
+        start = now - self.length
+        while self.samples[0][0] < start:
+            t, old = self.samples.popleft()
+            self._add(t, old, -1)
+        while self.minimums[0][0] < start:
+            self.minimums.popleft()
+        while self.maximums[0][0] < start:
+            self.maximums.popleft()
+        if now - self.base > 4 * self.length:
+            self._rebase(now)
+
+    def full(self, now):
+        """True once the window has been observed for its whole length."""
+        return self.first is not None and now - self.first >= self.length
+
+    def get(self, stat):
+        if stat == 'value':
+            return self.samples[-1][1]
+        if stat == 'mean':
+            return self.sv / self.n
+        if stat == 'min':
+            return self.minimums[0][1]
+        if stat == 'max':
+            return self.maximums[0][1]
+        if stat == 'range':
+            return self.maximums[0][1] - self.minimums[0][1]
+        denominator = self.n * self.stt - self.st * self.st
+        if self.n < 2 or denominator <= 0:
+            return 0.0
+        return (self.n * self.stv - self.st * self.sv) / denominator * 3600.0
+
+class Rule:
+    """One alarm condition on a topic.
+
+    Settings:
+      topic:      event to watch, e.g. TiltYellow.temperature
+      stat:       value (default), mean, min, max, range or rate (per hour) over window seconds
+      window:     window length in seconds for the statistics
+      above/below: threshold, either a number or another topic (e.g. Fridge.setpoint) plus offset
+      for:        seconds the condition must hold before the rule fires
+      silentFor:  fire when the topic has had no event for this many seconds instead
+    """
+
+    def __init__(self, engine, name, settings):
+        self.engine = engine
+        self.name = name
+        self.topic = settings['topic']
+        self.stat = settings.get('stat', 'value')
+        if self.stat not in STATS:
+            raise ValueError(f"Rule {name}: unknown stat {self.stat}")
+        self.window = Window(settings.get('window', 0))
+        self.above = settings.get('above')
+        self.below = settings.get('below')
+        self.offset = float(settings.get('offset', 0.0))
+        self.holdFor = float(settings.get('for', 0))
+        self.silentFor = settings.get('silentFor')
+        if self.silentFor is None and self.above is None and self.below is None:
+            raise ValueError(f"Rule {name}: needs above, below or silentFor")
+        self.active = False
+        self.condition = False
+        self.value = None
+        self.since = None
+        self.lastSeen = None
+        self.timer = None
+        self.fired = 0
+
+    def references(self):
+        return [ref for ref in (self.above, self.below) if isinstance(ref, str)]
+
+    def threshold(self, reference):
+        if isinstance(reference, str):
+            value = self.engine.latest.get(reference)
+            return None if value is None else value + self.offset
+        return reference
+
+    def update(self, now, value):
+        """Adds a reading to the window and re-evaluates the condition."""
+        self.lastSeen = now
+        if self.silentFor is not None:
+            self.setCondition(now, False)
+            if self.timer is None:
+                self.arm(float(self.silentFor))
+            return
+        self.window.add(now, value)
+        self.evaluate(now)
+
+    def evaluate(self, now):
+        if self.silentFor is not None or not self.window.samples:
+            return
+        if self.stat != 'value' and not self.window.full(now):
+            return  # A partly filled window would say gravity is flat right after startup
+        self.value = self.window.get(self.stat)
+        above, below = self.threshold(self.above), self.threshold(self.below)
+        condition = (above is not None and self.value > above) or (below is not None and self.value < below)
+        self.setCondition(now, condition)
+
+    def setCondition(self, now, condition):
+        if condition == self.condition:
+            return
+        self.condition = condition
+        if condition:
+            self.since = now
+            if self.holdFor > 0:
+                self.arm(self.holdFor)
+            else:
+                self.fire()
+        else:
+            self.disarm()
+            self.since = None
+            if self.active:
+                self.active = False
+                logger.info(f"{self.engine.name}: {self.name} cleared")
+                notify(Event(source=self.engine.name, endpoint=self.name, data=0))
+
+    def arm(self, delay):
+        self.disarm()
+        self.timer = asyncio.get_event_loop().call_later(delay, self.expired)
+
+    def disarm(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def expired(self):
+        self.timer = None
+        now = asyncio.get_event_loop().time()
+        if self.silentFor is not None:
+            # Readings only move lastSeen, so the timer is re-armed here instead of on every reading
+            remaining = self.lastSeen + float(self.silentFor) - now
+            if remaining > 0:
+                self.arm(remaining)
+                return
+            self.condition = True
+            self.since = self.lastSeen
+        if self.condition:
+            self.fire()
+
+    def fire(self):
+        if self.active:
+            return
+        self.active = True
+        self.fired += 1
+        if self.silentFor is not None:
+            logger.warning(f"{self.engine.name}: {self.name} fired (no {self.topic} for {self.silentFor} s)")
+        else:
+            logger.warning(f"{self.engine.name}: {self.name} fired ({self.topic} {self.stat} = {self.value})")
+        notify(Event(source=self.engine.name, endpoint=self.name, data=1))
+
+    def getState(self):
+        return {'topic': self.topic, 'stat': self.stat, 'value': self.value, 'condition': self.condition,
+                'active': self.active, 'since': self.since, 'fired': self.fired}
+
+class RuleEngine(interfaces.Component):
+    """Evaluates alarm rules as events arrive and emits {name}.{rule} events (1 fired, 0 cleared).
+
+    Rules are grouped by topic, so each event only touches the rules on
+    that topic and the rules using it as a threshold.
+    """
+
+    def __init__(self, name, rules):
+        self.name = name
+        self.rules = {}
+        self.byTopic = {}
+        self.byReference = {}
+        self.latest = {}
+        for ruleName, settings in rules.items():
+            rule = Rule(self, ruleName, settings)
+            self.rules[ruleName] = rule
+            self.byTopic.setdefault(rule.topic, []).append(rule)
+            for reference in rule.references():
+                self.byReference.setdefault(reference, []).append(rule)
+        for topic in set(self.byTopic) | set(self.byReference):
+            event.register(topic, lambda data, topic=topic: self.onEvent(topic, data), owner=self)
+        for topic in self.byReference:
+            # Controllers announce their first setpoint as initialSetpoint
+            source, endpoint = topic.rsplit('.', 1)
+            initial = f"{source}.initial{endpoint[:1].upper()}{endpoint[1:]}"
+            event.register(initial, lambda data, topic=topic: self.onEvent(topic, data), owner=self)
+        loop = asyncio.get_event_loop()
+        for rule in self.rules.values():
+            if rule.silentFor is not None:
+                # A topic that never reports at all is silent too
+                rule.lastSeen = loop.time()
+                rule.arm(float(rule.silentFor))
+        addRoute('GET', f'/rules/{self.name}', self.rulesView, owner=self)
+
+    def stop(self):
+        for rule in self.rules.values():
+            rule.disarm()
+
+    def onEvent(self, topic, data):
+        try:
+            value = float(data)
+        except (TypeError, ValueError):
+            return
+        now = asyncio.get_event_loop().time()
+        self.latest[topic] = value
+        for rule in self.byTopic.get(topic, ()):
+            rule.update(now, value)
+        for rule in self.byReference.get(topic, ()):
+            rule.evaluate(now)
+
+    async def rulesView(self, request):
+        return web.json_response({name: rule.getState() for name, rule in self.rules.items()})
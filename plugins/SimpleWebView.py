@@ -9,7 +9,7 @@ from aiohttp import web
 from functools import partial
 
 import interfaces
-from common import app
+from common import addRoute
 from event import notify, Event
 
 logger = logging.getLogger(__name__)
@@ -23,10 +23,10 @@ class SimpleWebView(interfaces.Component):
     def __init__(self, name, endpoints):
         self.name = name
         self.endpointData = {}
-        app.router.add_get('/simpleview', self.webView)
+        addRoute('GET', '/simpleview', self.webView, owner=self)
 
         for name in endpoints:
-            app.router.add_put("/%s"%name, partial(self.handler, name))
+            addRoute('PUT', "/%s"%name, partial(self.handler, name), owner=self)
 
     def callback(self, endpoint, data):
         self.endpointData[endpoint] = data
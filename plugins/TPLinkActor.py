@@ -1,7 +1,14 @@
 # filename: TPLinkActor.py
 
 import asyncio
+import json
 import logging
+import struct
+import sys
+from collections import deque
+
+import resilience
+import slowpwm
 from event import notify, Event
 from interfaces import Actor
 
@@ -16,142 +23,213 @@ def factory(name, settings):
 def encrypt(string):
     """Encrypts a string using XOR Autokey Cipher with a starting key of 171."""
     key = 171
-    result = b"\0\0\0" + chr(len(string)).encode('latin-1')
-    for i in string.encode('latin-1'):
-        a = key ^ i
-        key = a
-        result += chr(a).encode('latin-1')
-    return result
+    plain = string.encode('latin-1')
+    result = bytearray(struct.pack('>I', len(plain)))
+    for i in plain:
+        key ^= i
+        result.append(key)
+    return bytes(result)
 
 def decrypt(string):
     """Decrypts a string using XOR Autokey Cipher with a starting key of 171."""
     key = 171
-    result = ""
+    result = bytearray()
     for i in string:
-        a = key ^ i
+        result.append(key ^ i)
         key = i
-        result += chr(a)
-    return result
-
-class TPLinkProtocol(asyncio.Protocol):
-    """Protocol class to handle communication with the TP-Link SmartPlug."""
-    
-    def __init__(self):
-        self.transport = None
-        self.response_future = None
-
-    def connection_made(self, transport):
-        """Handles connection establishment to the SmartPlug."""
-        self.transport = transport
-        logger.debug("Connected to TPLink SmartPlug")
-
-    def connection_lost(self, exc):
-        """Handles connection loss and logs any exceptions."""
-        if exc:
-            logger.error(f"Connection lost: {exc}")
-        if self.response_future and not self.response_future.done():
-            self.response_future.set_exception(exc or Exception("Connection lost"))
-
-    def data_received(self, data):
-        """Handles data received from the SmartPlug and decrypts it."""
-        msg = decrypt(data[4:])
-        if self.response_future:
-            self.response_future.set_result(msg)
-        else:
-            logger.info(f"Received data but response_future is in an invalid state")
+    return result.decode('latin-1')
+
+def commandFailed(response):
+    """Returns True when any module of a parsed reply reports a non-zero err_code."""
+    return any(isinstance(reply, dict) and reply.get('err_code', 0) != 0
+               for module in response.values() if isinstance(module, dict)
+               for reply in module.values())
+
+class TPLinkClient:
+    """Pipelined command channel over one persistent TCP connection to a TP-Link SmartPlug.
+
+    Requests are written as soon as they are issued and the plug answers them
+    in order, so replies are matched to the oldest pending request. A lost
+    connection fails all pending requests and further connects are delayed by
+    an exponential backoff.
+    """
+
+    def __init__(self, host, port=9999, timeout=5.0, minBackoff=1.0, maxBackoff=60.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        self.reader = None
+        self.writer = None
+        self.pending = deque()
+        self.failures = 0
+        self.retryAt = 0.0
+        self.connectLock = asyncio.Lock()
+        self.readerTask = None
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        loop = asyncio.get_event_loop()
+        if loop.time() < self.retryAt:
+            raise ConnectionError(f"{self.host}: backing off for {self.retryAt - loop.time():.1f} s")
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.backoff()
+            raise ConnectionError(f"{self.host}: {e or 'connect timed out'}") from e
+        self.readerTask = loop.create_task(self.readLoop(self.reader))
+        logger.debug(f"Connected to TPLink SmartPlug {self.host}")
+
+    def backoff(self):
+        self.failures += 1
+        delay = min(self.maxBackoff, self.minBackoff * 2 ** (self.failures - 1))
+        self.retryAt = asyncio.get_event_loop().time() + delay
+
+    async def readLoop(self, reader):
+        """Reads length prefixed replies and resolves pending requests in order."""
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                payload = await reader.readexactly(struct.unpack('>I', header)[0])
+                reply = json.loads(decrypt(payload))
+                self.failures = 0
+                if self.pending:
+                    future = self.pending.popleft()
+                    if not future.done():
+                        future.set_result(reply)
+                else:
+                    logger.info(f"Unsolicited reply from {self.host}: {reply}")
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, OSError, ValueError) as e:
+            self.disconnect(ConnectionError(f"{self.host}: connection lost ({e})"))
+
+    def disconnect(self, exc=None):
+        """Closes the connection and fails every request still waiting for a reply."""
+        if self.writer is not None:
+            self.writer.close()
+        if self.readerTask is not None and self.readerTask is not asyncio.current_task():
+            self.readerTask.cancel()
+        self.reader = self.writer = self.readerTask = None
+        if exc is not None:
+            self.backoff()
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(exc or ConnectionError(f"{self.host}: connection closed"))
+
+    async def request(self, frame):
+        """Sends an encrypted frame and returns the decoded JSON reply."""
+        async with self.connectLock:
+            if self.writer is None:
+                await self.connect()
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append(future)
+        writer = self.writer
+        try:
+            writer.write(frame)
+            await writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError as e:
+            # Replies are matched by order, so an unanswered request poisons the stream
+            if self.writer is writer:
+                self.disconnect(ConnectionError(f"{self.host}: reply timed out"))
+            raise ConnectionError(f"{self.host}: reply timed out") from e
+        except OSError as e:
+            if self.writer is writer:
+                self.disconnect(ConnectionError(f"{self.host}: {e}"))
+            raise ConnectionError(f"{self.host}: {e}") from e
+
+    def close(self):
+        self.disconnect()
 
 class TPLinkActor(Actor):
     """Actor class to control a TP-Link SmartPlug."""
-    
+
     onMsg = '{"system":{"set_relay_state":{"state":1}}}'
     offMsg = '{"system":{"set_relay_state":{"state":0}}}'
     infoMsg = '{"system":{"get_sysinfo":{}}}'
-    refreshInterval = 10
+    onFrame = encrypt(onMsg)
+    offFrame = encrypt(offMsg)
+    infoFrame = encrypt(infoMsg)
 
     def __init__(self, name, settings):
         """Initializes the TPLinkActor with the given name and settings."""
         self.name = name
         self.power = 0
-        self.lastPowerState = None
         self.loop = asyncio.get_event_loop()
         self.settings = settings
-        asyncio.ensure_future(self.schedule())
-
-    async def schedule(self):
-        """Schedules sending on/off messages to the SmartPlug based on power level."""
-        while True:
-            if self.power == 100.0:
-                if self.lastPowerState != 100.0:
-                    logger.info(f"{self.name} SmartPlug is now ON")
-                await self.send(self.onMsg)
-                self.lastPowerState = 100.0
-                await asyncio.sleep(self.refreshInterval)
-            elif self.power == 0.0:
-                if self.lastPowerState != 0.0:
-                    logger.info(f"{self.name} SmartPlug is now OFF")
-                await self.send(self.offMsg)
-                self.lastPowerState = 0.0
-                await asyncio.sleep(self.refreshInterval)
-            else:
-                onTime = self.refreshInterval * self.power / 100.0
-                offTime = self.refreshInterval - onTime
-                await self.send(self.onMsg)
-                await asyncio.sleep(onTime)
-                await self.send(self.offMsg)
-                await asyncio.sleep(offTime)
+        resetTimeout = settings.get('resetTimeout', 30)
+        # Reconnect backoff stays below the breaker's reset timeout so half-open probes reach the plug
+        self.client = TPLinkClient(settings['ip'], settings.get('port', 9999), settings.get('timeout', 5.0),
+                                   maxBackoff=resetTimeout / 2)
+        self.guard = resilience.guard(self.name, timeout=2 * self.client.timeout, maxInFlight=4,
+                                      failureThreshold=settings.get('failureThreshold', 3),
+                                      resetTimeout=resetTimeout)
+        self.pwm = slowpwm.channel(self.name, self.switch,
+                                   cycleTime=settings.get('cycleTime', 10),
+                                   minOnTime=settings.get('minOnTime', 0),
+                                   minOffTime=settings.get('minOffTime', 0))
+
+    async def confirmOff(self):
+        await self.pwm.switchedOff()
+
+    def stop(self):
+        self.pwm.close()
+        self.client.close()
+
+    async def switch(self, on):
+        """Switches the SmartPlug relay; called by the slow PWM scheduler on transitions only."""
+        logger.info(f"{self.name} SmartPlug is now {'ON' if on else 'OFF'}")
+        response = await self.send(self.onFrame if on else self.offFrame)
+        return response is not None and not commandFailed(response)
 
     def updatePower(self, power):
         """Updates the power level and sends a notification."""
         self.power = power
+        self.pwm.setPower(power)
         notify(Event(source=self.name, endpoint='power', data=power))
 
     def getPower(self):
         """Returns the current power level."""
         return self.power
 
+    def reassert(self):
+        """Re-sends the current relay state to the SmartPlug."""
+        self.pwm.reassert()
+
     async def isRelayOn(self):
         """Checks the current state of the SmartPlug and logs whether it is ON or OFF."""
+        response = await self.send(self.infoFrame)
         try:
-            # Send the info message to get the relay state
-            response = await self.send(self.infoMsg)
-            if response:
-                # Parse the response to check the relay_state
-                if '"relay_state":1' in response:
-                    logger.info(f"{self.name} SmartPlug verified ON")
-                elif '"relay_state":0' in response:
-                    logger.info(f"{self.name} SmartPlug verified OFF")
-                else:
-                    logger.info(f"Unexpected response from {self.name}: {response}")
-            else:
-                logger.warning(f"Failed to get response from {self.name}: response: {response}")
-        except OSError as e:
-            logger.warning(f"TPLinkActor {self.name}: {e}")
-            print(f"TPLinkActor {self.name}: {e}")
+            relayState = response['system']['get_sysinfo']['relay_state']
+        except (KeyError, TypeError):
+            logger.warning(f"Failed to get relay state from {self.name}: response: {response}")
+            return None
+        logger.info(f"{self.name} SmartPlug verified {'ON' if relayState else 'OFF'}")
+        return bool(relayState)
 
-    async def send(self, msg):
-        """Sends an encrypted message to the SmartPlug."""
+    async def send(self, frame):
+        """Sends an encrypted frame to the SmartPlug and returns the parsed reply, or None on failure."""
         try:
-            transport, protocol = await self.loop.create_connection(lambda: TPLinkProtocol(), self.settings['ip'], 9999)
-            # protocol.response_future = self.loop.create_future() # Uncomment to process responses
-            transport.write(encrypt(msg))
-            # response = await protocol.response_future # Uncomment to process responses
-            # return response # Uncomment to process responses
-        except OSError as e:
+            response = await self.guard.call(self.client.request, frame)
+        except (ConnectionError, asyncio.TimeoutError) as e:
             logger.warning(f"TPLinkActor {self.name}: {e}")
             return None
-        finally:
-            transport.close()
+        if commandFailed(response):
+            logger.warning(f"TPLinkActor {self.name}: command failed: {response}")
+        return response
 
     def on(self):
         """Turns the SmartPlug on."""
-        logger.info(f"{self.name} SmartPlug is now ON")
-        asyncio.ensure_future(self.send(self.onMsg))
         self.updatePower(100.0)
 
     def off(self):
         """Turns the SmartPlug off."""
-        logger.info(f"{self.name} SmartPlug is now OFF")
-        asyncio.ensure_future(self.send(self.offMsg))
         self.updatePower(0.0)
 
     def callback(self, endpoint, data):
@@ -164,30 +242,80 @@ class TPLinkActor(Actor):
             else:
                 logger.warning(f"TPLinkActor {self.name}: unsupported data value for state endpoint: {data}")
         elif endpoint == 'power':
-            if data == 100.0:
-                self.on()
-            elif data == 0.0:
-                self.off()
-            else:
-                self.updatePower(data)
+            self.updatePower(data)
         else:
             logger.warning(f"TPLinkActor {self.name}: unsupported endpoint {endpoint}")
 
-if __name__ == '__main__':
-    def blip():
-        """Schedules a repeating task to keep the event loop running."""
-        asyncio.get_event_loop().call_later(0.1, blip)
+class FakeTPLinkPlug:
+    """Local stand-in for a TP-Link SmartPlug speaking the same framed, encrypted protocol."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.relayState = 0
+        self.commands = 0
+        self.server = None
+        self.connections = {}
 
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections)
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                request = json.loads(decrypt(await reader.readexactly(struct.unpack('>I', header)[0])))
+                self.commands += 1
+                system = request.get('system', {})
+                if 'set_relay_state' in system:
+                    self.relayState = system['set_relay_state']['state']
+                    reply = {'system': {'set_relay_state': {'err_code': 0}}}
+                elif 'get_sysinfo' in system:
+                    reply = {'system': {'get_sysinfo': {'relay_state': self.relayState, 'alias': 'fake', 'err_code': 0}}}
+                else:
+                    reply = {'system': {'err_code': -1}}
+                writer.write(encrypt(json.dumps(reply)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.connections[asyncio.current_task()]
+            writer.close()
+
+async def benchmark(host=None, count=2000):
+    """Measures sequential and pipelined commands per second against a plug (the fake one by default)."""
+    plug = None
+    if host is None:
+        plug = await FakeTPLinkPlug().start()
+        client = TPLinkClient(plug.host, plug.port)
+    else:
+        client = TPLinkClient(host)
     loop = asyncio.get_event_loop()
-    settings = {'ip': '192.168.8.116'}
-    actor = factory("TPLinkActor", settings)
-    loop.call_soon(blip)
 
-    actor.updatePower(15.0)
-    # actor.off()
+    start = loop.time()
+    for i in range(count):
+        await client.request(TPLinkActor.onFrame if i % 2 else TPLinkActor.offFrame)
+    sequential = count / (loop.time() - start)
 
-    try:
-        loop.run_forever()
-    finally:
-        loop.close()
+    start = loop.time()
+    await asyncio.gather(*[client.request(TPLinkActor.infoFrame) for i in range(count)])
+    pipelined = count / (loop.time() - start)
 
+    print(f"sequential: {sequential:.0f} commands/s, pipelined: {pipelined:.0f} commands/s")
+    client.close()
+    if plug:
+        await plug.stop()
+
+if __name__ == '__main__':
+    # python -m plugins.TPLinkActor [ip]  benchmarks a real plug, or a local fake plug without an ip
+    asyncio.run(benchmark(sys.argv[1] if len(sys.argv) > 1 else None))
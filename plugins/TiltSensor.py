@@ -7,6 +7,8 @@ import logging
 from decimal import Decimal, ROUND_HALF_UP
 from collections import deque
 
+import clock
+import interfaces
 from event import notify, Event
 
 logger = logging.getLogger(__name__)
@@ -62,7 +64,7 @@ def to_atten(sg, stgrav):
     return atten.quantize(Decimal('0.01'))
 
 # TiltSensor class handles data processing and notification for a specific Tilt hydrometer
-class TiltSensor:
+class TiltSensor(interfaces.Sensor):
     def __init__(self, name, color, tempcalbr, gravcalbr, startgrav, sendtime):
         if color not in tilt_colors:
             raise ValueError("Invalid color specified")
@@ -78,7 +80,7 @@ class TiltSensor:
         self.smoothing_window = 60
         self.gravity_list = deque(maxlen=self.smoothing_window)
         self.temp_list = deque(maxlen=self.smoothing_window)
-        self.last_value_received = datetime.datetime.now() - self._cache_expiry_seconds()
+        self.last_value_received = clock.now() - self._cache_expiry_seconds()
         self.lastTemp = Decimal(0.0).quantize(Decimal('0.1'))
         self.lastGravity = Decimal(0.0).quantize(Decimal('0.001'))
         self.lastABV = Decimal(0.0).quantize(Decimal('0.01'))
@@ -94,19 +96,27 @@ class TiltSensor:
             logger.error(f"Unable to create socket - {e}. Is there a Bluetooth adapter attached?")
             asyncio.get_event_loop().call_later(60, exit, 1)
 
-        asyncio.get_event_loop().create_task(self.run())
+        self.task = asyncio.get_event_loop().create_task(self.run())
+
+    def stop(self):
+        self.task.cancel()
+
+    async def shutdown(self):
+        # Scanning is switched off and the socket closed as the task is cancelled
+        self.stop()
+        await asyncio.gather(self.task, return_exceptions=True)
 
     def _cache_expiry_seconds(self) -> datetime.timedelta:
         return datetime.timedelta(seconds=(self.smoothing_window * 1.2 * 4))
 
     def expired(self) -> bool:
-        return self.last_value_received <= datetime.datetime.now() - self._cache_expiry_seconds()
+        return self.last_value_received <= clock.now() - self._cache_expiry_seconds()
 
     def _add_to_list(self, gravity, temp):
         if self.expired():
             self.gravity_list.clear()
             self.temp_list.clear()
-        self.last_value_received = datetime.datetime.now()
+        self.last_value_received = clock.now()
         self.gravity_list.append(gravity)
         self.temp_list.append(temp)
 
@@ -200,7 +210,7 @@ class TiltSensor:
                 self.lastOG = self.start_gravity
 
                 # Check if the notify interval has passed before sending notifications
-                current_time = datetime.datetime.now()
+                current_time = clock.now()
                 if (current_time - self.last_sendtime).total_seconds() >= self.sendtime:
                     notify(Event(source=self.name, endpoint='temperature', data=float(temp)))
                     notify(Event(source=self.name, endpoint='gravity', data=float(gravity)))
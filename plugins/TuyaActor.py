@@ -1,9 +1,13 @@
 # filename: TuyaActor.py
 
+import asyncio
 import logging
-import tinytuya
+import random
+import time
+
+import resilience
 from event import notify, Event
-from interfaces import Actor
+from interfaces import Actor, Offloaded
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +15,46 @@ def factory(name, settings):
     """Factory function to create a TuyaActor instance."""
     return TuyaActor(name, settings)
 
-class TuyaActor(Actor):
+class FakeTuyaDevice:
+    """Local stand-in for tinytuya.Device, used when the actor is configured with 'simulate: true'."""
+
+    def __init__(self, dev_id, address=None, local_key=None, latency=0.0, failureRate=0.0):
+        self.id = dev_id
+        self.latency = latency
+        self.failureRate = failureRate
+        self.dps = {}
+        self.calls = 0
+
+    def set_version(self, version):
+        pass
+
+    def set_socketPersistent(self, persist):
+        pass
+
+    def _respond(self):
+        self.calls += 1
+        time.sleep(self.latency)
+        if random.random() < self.failureRate:
+            return {'Error': 'Network Error: Device Unreachable', 'Err': '905'}
+        return {'devId': self.id, 'dps': dict(self.dps)}
+
+    def set_value(self, index, value, nowait=False):
+        response = self._respond()
+        if 'Error' not in response:
+            self.dps[str(index)] = value
+            response['dps'] = {str(index): value}
+        return response
+
+    def status(self):
+        return self._respond()
+
+    def heartbeat(self, nowait=False):
+        return self._respond()
+
+class TuyaActor(Actor, Offloaded):
+    offloadPoolName = 'tuya'
+    offloadWorkers = 4
+
     def __init__(self, name, settings):
         """Initialize the TuyaActor with device-specific settings."""
         self.name = name
@@ -20,11 +63,34 @@ class TuyaActor(Actor):
         self.local_key = settings.get("local_key")
         self.dps = settings.get("dps")  # DPS to control
         self.version = settings.get("version", 3.3)  # Default to 3.3
+        self.heartbeatInterval = settings.get("heartbeatInterval", 10)
+        self.pollInterval = settings.get("pollInterval", 60)
+        self.offloadTimeout = settings.get("timeout", 10)
+        self.guard = resilience.guard(self.name, timeout=self.offloadTimeout + 1, maxInFlight=1,
+                                      failureThreshold=settings.get("failureThreshold", 3),
+                                      resetTimeout=settings.get("resetTimeout", 60))
         self.power = 0
+        self.confirmedPower = None
+        self.pending = False
+        self.wakeup = asyncio.Event()
 
-        # Initialize Tuya device
-        self.device = tinytuya.Device(self.device_id, self.ip, self.local_key)
+        if settings.get("simulate"):
+            self.device = FakeTuyaDevice(self.device_id, latency=settings.get("simulateLatency", 0.2),
+                                         failureRate=settings.get("simulateFailureRate", 0.0))
+        else:
+            import tinytuya
+            self.device = tinytuya.Device(self.device_id, self.ip, self.local_key)
         self.device.set_version(self.version)
+        self.device.set_socketPersistent(True)
+
+        self.task = asyncio.get_event_loop().create_task(self.run())
+
+    async def confirmOff(self):
+        while self.power == 0 and (self.pending or self.confirmedPower != 0):
+            await asyncio.sleep(0.1)
+
+    def stop(self):
+        self.task.cancel()
 
     def on(self):
         """Turn the device socket on."""
@@ -35,30 +101,86 @@ class TuyaActor(Actor):
         self.updatePower(0, force=True)
 
     def updatePower(self, power, force=False):
-        """Update the power state and notify."""
+        """Queue the desired power state and notify; the device is updated asynchronously."""
         if power not in [0, 100]:  # Allow only valid power states for Tuya devices
             logger.warning(f"{self.name}: Invalid power value: {power}. Skipping update.")
             return
 
-        try:
-            state = power == 100
-            if self.power != power or force:  # Prevent redundant state updates
-                self.device.set_value(self.dps, state)
-                self.power = power
-                self.state = "ON" if state else "OFF"
-                logger.info(f"{self.name} set to {'ON' if state else 'OFF'}")
-            else:
-                logger.debug(f"{self.name}: Power state already set to {power}, skipping redundant update.")
+        if self.power != power or force:  # Prevent redundant state updates
+            # Only the latest desired state is kept, so bursts of commands collapse into one
+            self.power = power
+            self.state = "ON" if power == 100 else "OFF"
+            self.pending = True
+            self.wakeup.set()
+        else:
+            logger.debug(f"{self.name}: Power state already set to {power}, skipping redundant update.")
 
-            # Notify even if state didn't change, for consistency
-            notify(Event(source=self.name, endpoint="power", data=int(self.power)))
-        except Exception as e:
-            logger.error(f"Error setting power for {self.name}: {e}")
+        # Notify even if state didn't change, for consistency
+        notify(Event(source=self.name, endpoint="power", data=int(self.power)))
 
     def getPower(self):
         """Return the current power state."""
         return self.power
 
+    def reassert(self):
+        """Re-send the current power state to the device."""
+        self.updatePower(self.power, force=True)
+
+    async def call(self, method, *args):
+        """Runs a blocking tinytuya call off the loop, one at a time per device, and returns its response, or None on error."""
+        try:
+            response = await self.guard.call(self.offload, method, *args)
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out talking to {self.name}")
+            return None
+        except resilience.Unavailable as e:
+            logger.debug(str(e))
+            return None
+        except Exception as e:
+            logger.error(f"Error talking to {self.name}: {e}")
+            return None
+        if not isinstance(response, dict) or 'Error' in response:
+            logger.warning(f"{self.name}: device error: {response}")
+            return None
+        return response
+
+    async def run(self):
+        """Sends the latest desired state, keeps the session alive and reconciles with polled status."""
+        loop = asyncio.get_event_loop()
+        nextPoll = loop.time()
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.heartbeatInterval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+            if self.pending:
+                self.pending = False
+                power = self.power
+                response = await self.call(self.device.set_value, self.dps, power == 100)
+                if response is None:
+                    # Retry at the next heartbeat unless a newer command arrives first
+                    self.pending = True
+                else:
+                    self.confirmedPower = power
+                    logger.info(f"{self.name} set to {'ON' if power == 100 else 'OFF'}")
+            elif loop.time() >= nextPoll:
+                nextPoll = loop.time() + self.pollInterval
+                self.reconcile(await self.call(self.device.status))
+            else:
+                await self.call(self.device.heartbeat)
+
+    def reconcile(self, status):
+        """Updates the confirmed state from a status poll and re-sends the desired state if they differ."""
+        if status is None or str(self.dps) not in status.get('dps', {}):
+            return
+        self.confirmedPower = 100 if status['dps'][str(self.dps)] else 0
+        if self.confirmedPower != self.power:
+            logger.warning(f"{self.name}: device reports {self.confirmedPower}, expected {self.power}; re-sending")
+            self.pending = True
+            self.wakeup.set()
+
     def callback(self, endpoint, data):
         """Handle state updates from the controller."""
         if endpoint == "state":
@@ -68,4 +190,3 @@ class TuyaActor(Actor):
                 self.on()
             else:
                 logger.warning(f"{self.name}: unsupported data value: {data}")
-
@@ -1,34 +1,58 @@
 # filename: USBRelayActor.py
 
-from subprocess import call
-
+import slowpwm
 from event import notify, Event
 from interfaces import Actor
+from plugins.USBRelayBoard import getBoard
 
 def factory(name, settings):
-    return USBRelayActor(name, settings['id'], settings.get('inverted', False))
+    return USBRelayActor(name, settings['id'], settings.get('inverted', False), settings)
 
 
 class USBRelayActor(Actor):
-    def __init__(self, name, relayName, inverted):
+    """Handle on one channel of a USB relay board; the board driver batches the actual switching.
+
+    The relay is on for any power above 0, or time-proportioned by slow PWM
+    when cycleTime is configured.
+    """
+
+    def __init__(self, name, relayName, inverted, settings=None):
+        settings = settings or {}
         self.name = name
         self.power = 0.0
         self.relayName = relayName
         self.inverted = bool(inverted)
+        serial, self.channel = relayName.rsplit('_', 1)
+        self.board = getBoard(serial, settings.get('command', 'usbrelay'))
+        self.proportional = 'cycleTime' in settings
+        # Without cycleTime the channel only sees 0 or 100, but still keeps minOnTime/minOffTime and retries
+        self.pwm = slowpwm.channel(self.name, self.switch,
+                                   cycleTime=settings.get('cycleTime', 10),
+                                   minOnTime=settings.get('minOnTime', 0),
+                                   minOffTime=settings.get('minOffTime', 0))
         self.off()
 
+    async def confirmOff(self):
+        await self.pwm.switchedOff()
+
+    def stop(self):
+        self.pwm.close()
+
+    async def switch(self, on):
+        return await self.board.set(self.channel, on != self.inverted)
+
     def updatePower(self, power):
         self.power = power
-        print("Sending power %d to %s"%(power, self.name))
-        if (self.power and not self.inverted) or (not self.power and self.inverted):
-            call (["usbrelay", self.relayName + '=1'])
-        else:
-            call (["usbrelay", self.relayName + '=0'])
+        self.pwm.setPower(self.power if self.proportional or not self.power else 100.0)
         notify(Event(source=self.name, endpoint='power', data=power))
 
     def getPower(self):
         return self.power
 
+    def reassert(self):
+        self.board.state.pop(self.channel, None)
+        self.pwm.reassert()
+
     def on(self):
         self.updatePower(100.0)
 
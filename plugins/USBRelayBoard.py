@@ -0,0 +1,90 @@
+# filename: USBRelayBoard.py
+
+import asyncio
+import logging
+from subprocess import DEVNULL, PIPE
+
+import interfaces
+
+logger = logging.getLogger(__name__)
+
+boards = {}
+
+def factory(name, settings):
+    """Declares a board explicitly, e.g. to use a different usbrelay binary."""
+    board = getBoard(settings['serial'])
+    # Actors on the board may have been set up first and created it with their command
+    board.command = settings.get('command', 'usbrelay')
+    return board
+
+def getBoard(serial, command='usbrelay'):
+    """Returns the driver owning the board with the given serial, creating it on first use."""
+    if serial not in boards:
+        boards[serial] = USBRelayBoard(serial, command)
+    return boards[serial]
+
+class USBRelayBoard(interfaces.Component):
+    """Owns one USB HID relay board and drives all of its channels.
+
+    Channel changes requested in the same event loop turn, or while a
+    previous invocation is still running, are sent together in a single
+    asynchronous usbrelay call. Channels already in the requested state are
+    skipped.
+    """
+
+    def __init__(self, serial, command='usbrelay'):
+        self.name = serial
+        self.serial = serial
+        self.command = command
+        self.state = {}
+        self.pending = {}
+        self.waiters = []
+        self.flushing = None
+        self.invocations = 0
+
+    def set(self, channel, on):
+        """Requests a channel state; returns a future resolving to True once the board confirms it."""
+        future = asyncio.get_event_loop().create_future()
+        if self.state.get(channel) == on and channel not in self.pending:
+            future.set_result(True)
+            return future
+        self.pending[channel] = on
+        self.waiters.append(future)
+        if self.flushing is None:
+            self.flushing = asyncio.ensure_future(self.flush())
+        return future
+
+    async def flush(self):
+        try:
+            await asyncio.sleep(0)  # Let other channels join this batch
+            while self.pending:
+                changes = {channel: on for channel, on in self.pending.items() if self.state.get(channel) != on}
+                waiters = self.waiters
+                self.pending = {}
+                self.waiters = []
+                ok = not changes or await self.invoke(changes)
+                if ok:
+                    self.state.update(changes)
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(ok)
+        finally:
+            self.flushing = None
+
+    async def invoke(self, changes):
+        args = [f"{self.serial}_{channel}={int(on)}" for channel, on in sorted(changes.items())]
+        self.invocations += 1
+        try:
+            process = await asyncio.create_subprocess_exec(self.command, *args, stdout=DEVNULL, stderr=PIPE)
+            _, stderr = await process.communicate()
+        except OSError as e:
+            logger.error(f"USBRelayBoard {self.serial}: cannot run {self.command}: {e}")
+            return False
+        if process.returncode != 0:
+            logger.error(f"USBRelayBoard {self.serial}: {self.command} {' '.join(args)} failed: {stderr.decode(errors='replace').strip()}")
+            # The board state is unknown now, so the next request for these channels is always sent
+            for channel in changes:
+                self.state.pop(channel, None)
+            return False
+        logger.debug(f"USBRelayBoard {self.serial}: {' '.join(args)}")
+        return True
@@ -6,29 +6,44 @@ import json
 import logging
 
 import interfaces
+import resilience
 
 logger = logging.getLogger(__name__)
 
 def factory(name, settings):
-    return UbidotsLogger(name, settings['token'], settings['variables'])   
+    return UbidotsLogger(name, settings['token'], settings['variables'], settings.get('timeout', 10))
 
 class UbidotsLogger(interfaces.Component):
-    def __init__(self, name, ubidotsToken, variables):
+    def __init__(self, name, ubidotsToken, variables, timeout=10):
         self.name = name
-        self.session = aiohttp.ClientSession()
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout))
         self.headers = {'X-Auth-Token': ubidotsToken, 'Content-Type': 'application/json'}
         self.variables = variables
         self.loop = asyncio.get_event_loop()
+        self.posts = set()
+        # While ubidots is unreachable, posts are dropped instead of piling up
+        self.guard = resilience.guard(self.name, timeout=timeout, maxInFlight=4, failureThreshold=3, resetTimeout=60)
 
+    async def post(self, url, data):
+        async with self.session.post(url, data=data, headers=self.headers) as response:
+            response.raise_for_status()
 
     async def postToUbidots(self, endpoint, data):
         try:
-            response = await self.session.post('http://things.ubidots.com/api/v1.6/variables/%s/values'%self.variables[endpoint],
-                                data=json.dumps({'value': data}), headers=self.headers)
-        except (aiohttp.ClientConnectorError, aiohttp.ServerDisconnectedError) as e:
-            logger.warning("Failed to connect to ubidots %s"%str(e))
+            await self.guard.call(self.post, 'http://things.ubidots.com/api/v1.6/variables/%s/values'%self.variables[endpoint],
+                                  json.dumps({'value': data}))
+        except resilience.Unavailable as e:
+            logger.debug("Not posting to ubidots: %s"%str(e))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Failed to post to ubidots %r"%e)
 
 
     def callback(self, endpoint, data):
-        asyncio.ensure_future(self.postToUbidots(endpoint, data))
-
+        post = asyncio.ensure_future(self.postToUbidots(endpoint, data))
+        self.posts.add(post)
+        post.add_done_callback(self.posts.discard)
+
+    async def shutdown(self):
+        # Let the posts already made go out
+        await asyncio.gather(*self.posts, return_exceptions=True)
+        await self.session.close()
@@ -1,11 +1,12 @@
 # filename: W1Sensor.py
 
 import aiofiles
-import asyncio
 import datetime
 import logging
 import re
 
+import clock
+import scheduler
 from event import notify, Event
 from interfaces import Sensor
 from plugins.DummySensor import factory as dsfactory
@@ -35,9 +36,8 @@ class W1Sensor(Sensor):
         self.poll_interval = poll_interval
         self.send_time = send_time
         self.last_send_time = datetime.datetime.min
-        self.running = True
-        # Start the polling task
-        asyncio.get_event_loop().create_task(self.run())
+        # Start polling
+        self.job = scheduler.every(self.poll_interval, self.poll, name=f'{self.name}.poll', owner=self)
 
     def is_sensor_available(self):
         """
@@ -51,17 +51,15 @@ class W1Sensor(Sensor):
         except Exception as e:
             return False
 
-    async def run(self):
-        while self.running:
-            try:
-                self.last_temp = await self.read_temp() + self.offset
-                current_time = datetime.datetime.now()
-                if (current_time - self.last_send_time).total_seconds() >= self.send_time:
-                    notify(Event(source=self.name, endpoint='temperature', data=self.last_temp))
-                    self.last_send_time = current_time
-            except Exception as e:
-                pass
-            await asyncio.sleep(self.poll_interval)
+    async def poll(self):
+        try:
+            self.last_temp = await self.read_temp() + self.offset
+            current_time = clock.now()
+            if (current_time - self.last_send_time).total_seconds() >= self.send_time:
+                notify(Event(source=self.name, endpoint='temperature', data=self.last_temp))
+                self.last_send_time = current_time
+        except Exception as e:
+            pass
 
     async def read_temp(self):
         try:
@@ -6,7 +6,7 @@ import logging
 from aiohttp import web
 
 import interfaces
-from common import app
+from common import addRoute
 from event import notify, Event
 
 logger = logging.getLogger(__name__)
@@ -18,7 +18,7 @@ class iSpindelSensor(interfaces.Sensor):
     def __init__(self, name, settings):
         self.name = name
         self.last_temperature = 0
-        app.router.add_post('/ispindel/%s'%name, self.post_handler)
+        addRoute('POST', '/ispindel/%s'%name, self.post_handler, owner=self)
 
     async def run(self):
         while True:
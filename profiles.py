@@ -0,0 +1,167 @@
+# filename: profiles.py
+
+import bisect
+import json
+import logging
+import os
+
+import clock
+
+logger = logging.getLogger(__name__)
+
+profiles = {}
+statePath = None
+state = {}
+
+DURATION_UNITS = {'minutes': 60, 'hours': 3600, 'days': 86400}
+
+class Schedule:
+    """Piecewise-linear setpoint over seconds since the profile started.
+
+    Breakpoints are precomputed, so a lookup is a bisection plus one
+    interpolation. A step in the setpoint is two breakpoints at the same time.
+    """
+
+    def __init__(self, times, values, stepEnds):
+        self.times = times
+        self.values = values
+        self.stepEnds = stepEnds
+        self.slopes = [(v1 - v0) / (t1 - t0) if t1 > t0 else 0.0
+                       for t0, t1, v0, v1 in zip(times, times[1:], values, values[1:])]
+        self.duration = times[-1]
+
+    def at(self, offset):
+        i = bisect.bisect_right(self.times, offset)
+        if i == 0:
+            return self.values[0]
+        if i == len(self.times):
+            return self.values[-1]
+        return self.values[i - 1] + self.slopes[i - 1] * (offset - self.times[i - 1])
+
+    def stepAt(self, offset):
+        """Index of the profile step running at offset; len(steps) once finished."""
+        return bisect.bisect_right(self.stepEnds, offset)
+
+class Profile:
+    """A named list of ramp and hold steps, e.g.
+
+        - hold: 66      # go to 66 and hold for three days
+          days: 3
+        - ramp: 70      # ramp linearly to 70 over a day
+          hours: 24
+        - hold: 35      # crash; a final hold without duration lasts forever
+    """
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = []
+        for number, step in enumerate(steps or [], 1):
+            kind = 'ramp' if 'ramp' in step else 'hold' if 'hold' in step else None
+            if kind is None:
+                raise ValueError(f"Profile {name} step {number}: needs 'ramp' or 'hold'")
+            duration = sum(float(step[unit]) * seconds for unit, seconds in DURATION_UNITS.items() if unit in step)
+            if duration <= 0 and (kind == 'ramp' or number < len(steps)):
+                raise ValueError(f"Profile {name} step {number}: needs a duration in minutes, hours or days")
+            self.steps.append((kind, float(step[kind]), duration))
+        if not self.steps:
+            raise ValueError(f"Profile {name} has no steps")
+
+    def compile(self, startSetpoint):
+        """Builds the schedule; ramps in the first step start from startSetpoint."""
+        t, value = 0.0, float(startSetpoint)
+        times, values, stepEnds = [t], [value], []
+        for kind, target, duration in self.steps:
+            if kind == 'hold' and target != value:
+                times.append(t)
+                values.append(target)
+            t += duration
+            value = target
+            times.append(t)
+            values.append(value)
+            stepEnds.append(t)
+        return Schedule(times, values, stepEnds)
+
+class ProfileRun:
+    """A profile running on one controller since startedAt (clock time)."""
+
+    def __init__(self, profile, startedAt, startSetpoint):
+        self.profile = profile
+        self.startedAt = startedAt
+        self.startSetpoint = startSetpoint
+        self.schedule = profile.compile(startSetpoint)
+
+    def setpoint(self, now):
+        return self.schedule.at(now - self.startedAt)
+
+    def getDetails(self, now):
+        offset = now - self.startedAt
+        step = self.schedule.stepAt(offset)
+        return {
+            'name': self.profile.name,
+            'step': min(step + 1, len(self.profile.steps)),
+            'steps': len(self.profile.steps),
+            'elapsed': offset,
+            'remaining': max(self.schedule.duration - offset, 0.0),
+            'finished': step >= len(self.profile.steps) and self.profile.steps[-1][2] > 0,
+        }
+
+def configure(settings, path):
+    """Loads the profile definitions and the saved state of running profiles."""
+    global statePath, state
+    profiles.clear()
+    for name, steps in (settings or {}).items():
+        profiles[name] = Profile(name, steps)
+    statePath = path
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot read profile state from {path}: {e}")
+        state = {}
+
+def saveState():
+    if statePath is None:
+        return
+    tmp = f"{statePath}.tmp"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, statePath)
+    except OSError as e:
+        logger.error(f"Cannot save profile state to {statePath}: {e}")
+
+def start(controllerName, profileName, startSetpoint, startedAt=None):
+    """Starts a profile on a controller now (or at startedAt) and remembers it across restarts."""
+    if profileName not in profiles:
+        raise ValueError(f"Unknown profile {profileName}")
+    startedAt = clock.time() if startedAt is None else startedAt
+    run = ProfileRun(profiles[profileName], startedAt, startSetpoint)
+    state[controllerName] = {'profile': profileName, 'startedAt': startedAt, 'startSetpoint': startSetpoint}
+    saveState()
+    logger.info(f"{controllerName}: starting profile {profileName}")
+    return run
+
+def stop(controllerName):
+    """Stops a controller's profile; it stays stopped after a restart."""
+    state[controllerName] = {'profile': None}
+    saveState()
+    logger.info(f"{controllerName}: profile stopped")
+
+def resume(controllerName, configured, startSetpoint):
+    """Returns the controller's profile run at the offset it had reached, or starts the configured one.
+
+    A profile stopped over the websocket is not restarted from config.
+    """
+    saved = state.get(controllerName)
+    if saved is not None:
+        if saved.get('profile') is None:
+            return None
+        if saved['profile'] in profiles:
+            logger.info(f"{controllerName}: resuming profile {saved['profile']}")
+            return ProfileRun(profiles[saved['profile']], saved['startedAt'], saved['startSetpoint'])
+        logger.warning(f"{controllerName}: saved profile {saved['profile']} is no longer configured")
+    if configured:
+        return start(controllerName, configured, startSetpoint)
+    return None
@@ -0,0 +1,118 @@
+# filename: resilience.py
+
+import asyncio
+import logging
+
+from event import notify, Event
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+class Unavailable(ConnectionError):
+    """Raised without touching the destination when its circuit is open or it is saturated."""
+
+class CircuitBreaker:
+    """Opens after repeated failures and lets a limited number of probes through after resetTimeout."""
+
+    def __init__(self, name, failureThreshold=5, resetTimeout=30.0, halfOpenProbes=1):
+        self.name = name
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.halfOpenProbes = halfOpenProbes
+        self.state = CLOSED
+        self.failures = 0
+        self.openedAt = 0.0
+        self.probes = 0
+
+    def _setState(self, state):
+        if state != self.state:
+            logger.warning(f"{self.name}: circuit {self.state} -> {state}")
+            self.state = state
+            notify(Event(source=self.name, endpoint='health', data=state))
+
+    def allow(self):
+        if self.state == OPEN:
+            if asyncio.get_event_loop().time() < self.openedAt + self.resetTimeout:
+                return False
+            self.probes = 0
+            self._setState(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probes >= self.halfOpenProbes:
+                return False
+            self.probes += 1
+        return True
+
+    def success(self):
+        self.failures = 0
+        self._setState(CLOSED)
+
+    def release(self):
+        """Gives back a half-open probe whose call ended without a verdict (cancelled)."""
+        if self.state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failureThreshold:
+            self.openedAt = asyncio.get_event_loop().time()
+            self._setState(OPEN)
+
+class Guard:
+    """Deadline, circuit breaker and in-flight limit for calls to one network destination."""
+
+    # Anything but cancellation counts against the destination; a cancelled probe is released instead
+    failureExceptions = (Exception,)
+
+    def __init__(self, name, timeout=5.0, maxInFlight=2, failureThreshold=5, resetTimeout=30.0):
+        self.name = name
+        self.timeout = timeout
+        self.maxInFlight = maxInFlight
+        self.inFlight = 0
+        self.rejected = 0
+        self.breaker = CircuitBreaker(name, failureThreshold, resetTimeout)
+
+    @property
+    def state(self):
+        return self.breaker.state
+
+    async def call(self, fn, *args, timeout=None):
+        """Awaits fn(*args) within the deadline; raises Unavailable instead of calling when the destination is down or busy."""
+        if self.inFlight >= self.maxInFlight:
+            self.rejected += 1
+            raise Unavailable(f"{self.name}: {self.inFlight} requests already in flight")
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise Unavailable(f"{self.name}: circuit {self.breaker.state}")
+        self.inFlight += 1
+        try:
+            result = await asyncio.wait_for(fn(*args), self.timeout if timeout is None else timeout)
+        except self.failureExceptions:
+            self.breaker.failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        finally:
+            self.inFlight -= 1
+        self.breaker.success()
+        return result
+
+    def getHealth(self):
+        return {'state': self.state, 'failures': self.breaker.failures, 'inFlight': self.inFlight, 'rejected': self.rejected}
+
+guards = {}
+
+def guard(name, **settings):
+    """Creates the guard for a component's destination and registers it for GET /health.
+
+    A component rebuilt on a config reload gets a new guard, with its new
+    settings and a closed circuit, replacing the old one.
+    """
+    guards[name] = Guard(name, **settings)
+    return guards[name]
+
+def health():
+    return {name: g.getHealth() for name, g in guards.items()}
@@ -0,0 +1,166 @@
+# filename: scheduler.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """A periodic job registered with the Scheduler."""
+
+    def __init__(self, scheduler, name, interval, fn, phase=0.0, jitter=0.0, priority=0, owner=None):
+        self.scheduler = scheduler
+        self.name = name
+        self.interval = float(interval)
+        self.fn = fn
+        self.phase = float(phase)
+        self.jitter = float(jitter)
+        self.priority = priority
+        self.owner = owner
+        self.start = None
+        self.runNumber = 0
+        self.due = None
+        self.task = None
+        self.cancelled = False
+        self.stats = {'runs': 0, 'skipped': 0, 'errors': 0, 'lateMax': 0.0, 'lateTotal': 0.0,
+                      'durationMax': 0.0, 'durationTotal': 0.0}
+
+    def nextDue(self, now=None):
+        """Deadlines are computed from the start time, not the previous run, so they never drift.
+
+        Periods missed entirely (e.g. while the loop was blocked) are skipped rather than caught up.
+        """
+        self.runNumber += 1
+        if now is not None and self.start + self.phase + self.runNumber * self.interval <= now:
+            self.runNumber = int((now - self.start - self.phase) // self.interval) + 1
+        offset = random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return self.start + self.phase + self.runNumber * self.interval + offset
+
+    def cancel(self):
+        self.cancelled = True
+        if self.task is not None:
+            self.task.cancel()
+
+    def getStats(self):
+        runs = max(self.stats['runs'], 1)
+        return dict(self.stats, interval=self.interval, priority=self.priority,
+                    lateAvg=self.stats['lateTotal'] / runs, durationAvg=self.stats['durationTotal'] / runs)
+
+class Scheduler:
+    """Runs every periodic job from one task.
+
+    Jobs falling due within batchWindow seconds of each other are run in the
+    same wakeup, highest priority first. Coroutine jobs run as tasks; a job
+    whose previous run has not finished is skipped for that period.
+    """
+
+    def __init__(self, batchWindow=0.05):
+        self.batchWindow = batchWindow
+        self.heap = []
+        self.counter = itertools.count()
+        self.jobs = {}
+        self.wakeup = None
+        self.task = None
+        self.wakeups = 0
+
+    def time(self):
+        return asyncio.get_event_loop().time()
+
+    def every(self, interval, fn, name=None, phase=0.0, jitter=0.0, priority=0, owner=None):
+        """Registers fn (a function or coroutine function) to run every interval seconds after phase seconds."""
+        name = name or getattr(fn, '__qualname__', repr(fn))
+        if not float(interval) > 0:
+            raise ValueError(f"Job {name}: interval must be greater than 0, not {interval}")
+        if name in self.jobs:
+            name = f"{name}#{next(self.counter)}"
+        job = Job(self, name, interval, fn, phase, jitter, priority, owner)
+        job.start = self.time()
+        job.runNumber = -1
+        self.push(job, job.nextDue())
+        self.jobs[name] = job
+        return job
+
+    def push(self, job, due):
+        job.due = due
+        heapq.heappush(self.heap, (due, -job.priority, next(self.counter), job))
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+        elif self.heap[0][3] is job:
+            self.wakeup.set()
+
+    def cancel(self, job):
+        job.cancel()
+        self.jobs.pop(job.name, None)
+
+    def cancelOwner(self, owner):
+        for job in [job for job in self.jobs.values() if job.owner is owner]:
+            self.cancel(job)
+
+    def execute(self, job, now):
+        late = now - job.due
+        job.stats['lateMax'] = max(job.stats['lateMax'], late)
+        job.stats['lateTotal'] += late
+        if job.task is not None and not job.task.done():
+            job.stats['skipped'] += 1
+            return
+        job.stats['runs'] += 1
+        started = self.time()
+        try:
+            result = job.fn()
+        except Exception as e:
+            job.stats['errors'] += 1
+            logger.exception(f"Scheduled job {job.name} failed: {e}")
+            return
+        if asyncio.iscoroutine(result):
+            job.task = asyncio.ensure_future(result)
+            job.task.add_done_callback(lambda task, job=job, started=started: self.finished(job, started, task))
+        else:
+            self.finished(job, started)
+
+    def finished(self, job, started, task=None):
+        duration = self.time() - started
+        job.stats['durationMax'] = max(job.stats['durationMax'], duration)
+        job.stats['durationTotal'] += duration
+        if task is not None and not task.cancelled() and task.exception() is not None:
+            job.stats['errors'] += 1
+            logger.error(f"Scheduled job {job.name} failed: {task.exception()!r}")
+
+    async def run(self):
+        while True:
+            now = self.time()
+            if self.heap and self.heap[0][0] <= now + self.batchWindow:
+                self.wakeups += 1
+                due = []
+                while self.heap and self.heap[0][0] <= now + self.batchWindow:
+                    due.append(heapq.heappop(self.heap)[3])
+                due.sort(key=lambda job: -job.priority)
+                for job in due:
+                    if job.cancelled:
+                        continue
+                    self.execute(job, now)
+                    self.push(job, job.nextDue(now))
+            self.wakeup.clear()
+            timeout = max(self.heap[0][0] - self.time(), 0.0) if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def getStats(self):
+        return {'wakeups': self.wakeups, 'jobs': {name: job.getStats() for name, job in self.jobs.items()}}
+
+_scheduler = None
+
+def scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
+
+def every(interval, fn, **kwargs):
+    """Registers a periodic job on the shared scheduler."""
+    return scheduler().every(interval, fn, **kwargs)
@@ -0,0 +1,151 @@
+# filename: shutdown.py
+
+import asyncio
+import logging
+import time
+
+import controller
+import event
+import interfaces
+import scheduler
+from common import components
+
+logger = logging.getLogger(__name__)
+
+# Steps reached after the deadline still get this long, so tasks are always cancelled
+GRACE = 0.1
+
+class ShutdownCoordinator:
+    """Brings tfdeux down within a total deadline.
+
+    On aiohttp's on_shutdown the controllers and extensions are stopped and
+    connections dropped, so nothing drives the actors any more, and every
+    actor is switched off concurrently and, where the actor can tell,
+    confirmed off. On on_cleanup the components
+    are shut down in reverse dependency order (controllers, extensions,
+    actors, sensors; each group concurrently), registered flush steps run
+    and offload pools finish their calls in flight. Whatever did not finish
+    in time is reported instead of holding up the exit.
+
+    Settings (the optional 'shutdown' section):
+      deadline:  seconds for the whole shutdown (default 10)
+    """
+
+    def __init__(self, deadline=10.0):
+        self.deadline = float(deadline)
+        self.started = None
+        self.flushes = []
+        self.report = {}
+
+    def addFlush(self, name, fn, early=False):
+        """Runs the coroutine function fn while shutting down, after the components have stopped.
+
+        An early flush starts before the actors are switched off instead, and
+        runs alongside them.
+        """
+        self.flushes.append((name, fn, early))
+
+    def remaining(self):
+        return max(self.deadline - (time.monotonic() - self.started), 0.0)
+
+    async def step(self, phase, name, coroutine):
+        """Runs one shutdown step within the remaining time and records how it went."""
+        began = time.monotonic()
+        try:
+            await asyncio.wait_for(coroutine, max(self.remaining(), GRACE))
+            status = 'ok'
+        except asyncio.TimeoutError:
+            status = 'timeout'
+        except Exception as e:
+            status = f"failed: {type(e).__name__}: {e}"
+        self.report.setdefault(phase, {})[name] = {'status': status, 'time': round(time.monotonic() - began, 3)}
+
+    async def actorOff(self, actor):
+        actor.off()
+        await actor.confirmOff()
+
+    async def actorShutdown(self, actor):
+        # Closing a slow PWM channel freezes the output, so it has to be off first
+        try:
+            await self.actorOff(actor)
+        finally:
+            await actor.shutdown()
+
+    def quiesce(self):
+        """Stops everything that can drive actors: controllers, extensions (RuleEngine) and connections."""
+        for phase, group in self.groups():
+            if phase in ('controllers', 'extensions'):
+                for component in group:
+                    scheduler.scheduler().cancelOwner(component)
+                    event.unregisterOwner(component)
+                    component.stop()
+        # Connections are owned by their 'Sender.endpoint => Receiver.endpoint' string
+        for owner in [owner for owner in event.owned if isinstance(owner, str)]:
+            event.unregisterOwner(owner)
+
+    @staticmethod
+    def groups():
+        """Components in reverse dependency order."""
+        controllers, extensions, actors, sensors = [], [], [], []
+        for component in list(components.values()):
+            if isinstance(component, controller.Controller):
+                controllers.append(component)
+            elif isinstance(component, interfaces.Actor):
+                actors.append(component)
+            elif isinstance(component, interfaces.Sensor):
+                sensors.append(component)
+            else:
+                extensions.append(component)
+        return [('controllers', controllers), ('extensions', extensions), ('actors', actors), ('sensors', sensors)]
+
+    async def onShutdown(self, app):
+        self.started = time.monotonic()
+        actors = [c for c in components.values() if isinstance(c, interfaces.Actor)]
+        logger.warning(f"Shutting down, switching off {len(actors)} actors")
+        self.quiesce()
+        # Tasks start in order, so early flushes run up to their first await before any actor is off
+        await asyncio.gather(*(self.step('flush', name, fn()) for name, fn, early in self.flushes if early),
+                             *(self.step('actors off', actor.name, self.actorOff(actor)) for actor in actors))
+
+    async def onCleanup(self, app):
+        if self.started is None:
+            self.started = time.monotonic()
+        for phase, group in self.groups():
+            for component in group:
+                scheduler.scheduler().cancelOwner(component)
+            shutdown = self.actorShutdown if phase == 'actors' else lambda component: component.shutdown()
+            await asyncio.gather(*(self.step(phase, component.name, shutdown(component)) for component in group))
+        for name, fn, early in self.flushes:
+            if not early:
+                await self.step('flush', name, fn())
+        for name, pool in interfaces.offloadPools.items():
+            await self.step('offload', name, pool.drain())
+            pool.shutdown()
+        self.logReport()
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+
+    def unfinished(self):
+        return [f"{phase} {name} ({result['status']})" for phase, steps in self.report.items()
+                for name, result in steps.items() if result['status'] != 'ok']
+
+    def logReport(self):
+        elapsed = time.monotonic() - self.started
+        unfinished = self.unfinished()
+        if unfinished:
+            logger.warning(f"Shutdown took {elapsed:.2f} s of {self.deadline:g} s; not finished: {', '.join(unfinished)}")
+        else:
+            logger.warning(f"Shutdown complete in {elapsed:.2f} s")
+        for phase, steps in self.report.items():
+            for name, result in steps.items():
+                logger.info(f"  {phase:<12} {name:<20} {result['status']:<8} {result['time']:.3f} s")
+
+coordinator = None
+
+def setup(app, settings=None):
+    """Hooks the shutdown coordinator into the app's on_shutdown and on_cleanup."""
+    global coordinator
+    coordinator = ShutdownCoordinator(**(settings or {}))
+    app.on_shutdown.append(coordinator.onShutdown)
+    app.on_cleanup.append(coordinator.onCleanup)
+    return coordinator
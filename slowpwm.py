@@ -0,0 +1,164 @@
+# filename: slowpwm.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SlowPWMChannel:
+    """Time-proportioned on/off output driven by the shared SlowPWMScheduler.
+
+    The output is on for power% of every cycle. The switch callable is only
+    invoked on transitions and never before the minimum on or off time has
+    passed since the previous transition. A switch coroutine returning False
+    has the state re-sent after retryInterval; like a reassert, this still
+    respects the minimum on and off time of the last switched state.
+    """
+
+    def __init__(self, scheduler, name, switch, cycleTime=10.0, minOnTime=0.0, minOffTime=0.0, retryInterval=5.0):
+        self.scheduler = scheduler
+        self.name = name
+        self.switch = switch
+        self.cycleTime = float(cycleTime)
+        self.minOnTime = float(minOnTime)
+        self.minOffTime = float(minOffTime)
+        self.retryInterval = float(retryInterval)
+        self.power = 0.0
+        self.state = None
+        self.changedAt = float('-inf')
+        # Set when the output may not match state and has to be switched again
+        self.resend = False
+        self.cycleStart = None
+        self.switches = 0
+        self.version = 0
+        self.closed = False
+        self.confirming = None
+
+    def setPower(self, power):
+        """Sets the duty cycle in percent; takes effect immediately within the current cycle."""
+        self.power = min(max(float(power), 0.0), 100.0)
+        self.scheduler.schedule(self, self.scheduler.time())
+
+    def reassert(self):
+        """Has the next evaluation switch the output again, even if it should already be in that state."""
+        self.resend = True
+        self.scheduler.schedule(self, self.scheduler.time())
+
+    def close(self):
+        """Stops driving the output, e.g. when the actor is replaced on a config reload."""
+        self.closed = True
+        self.version += 1
+
+    def desired(self, now):
+        """Returns the wanted output state and when it next changes."""
+        if self.power >= 100.0:
+            return True, None
+        if self.power <= 0.0:
+            return False, None
+        if self.cycleStart is None or now - self.cycleStart >= 2 * self.cycleTime:
+            self.cycleStart = now
+        elif now - self.cycleStart >= self.cycleTime:
+            self.cycleStart += self.cycleTime
+        onTime = self.cycleTime * self.power / 100.0
+        if now - self.cycleStart < onTime:
+            return True, self.cycleStart + onTime
+        return False, self.cycleStart + self.cycleTime
+
+    def evaluate(self, now):
+        """Switches the output if needed and returns the next deadline, or None when idle."""
+        wanted, nextChange = self.desired(now)
+        if wanted == self.state and not self.resend:
+            return nextChange
+        if wanted != self.state and self.state is not None:
+            holdUntil = self.changedAt + (self.minOnTime if self.state else self.minOffTime)
+            if now < holdUntil:
+                return holdUntil
+        if wanted != self.state:
+            self.changedAt = now
+        self.state = wanted
+        self.resend = False
+        self.switches += 1
+        logger.debug(f"{self.name}: switching {'ON' if wanted else 'OFF'} at {self.power}%")
+        result = self.switch(wanted)
+        if asyncio.iscoroutine(result):
+            self.confirming = asyncio.ensure_future(self.confirm(result))
+        return nextChange
+
+    async def switchedOff(self):
+        """Returns once the output is confirmed off, or as soon as the power is raised again."""
+        while self.power <= 0.0:
+            if self.confirming is not None and not self.confirming.done():
+                await asyncio.shield(self.confirming)
+            elif self.state is False and not self.resend:
+                return
+            else:
+                await asyncio.sleep(0.05)
+
+    async def confirm(self, switching):
+        try:
+            confirmed = await switching
+        except Exception as e:
+            logger.error(f"{self.name}: switching failed: {e!r}")
+            confirmed = False
+        if confirmed is False:
+            self.resend = True
+            self.scheduler.schedule(self, self.scheduler.time() + self.retryInterval)
+
+class SlowPWMScheduler:
+    """Drives every SlowPWMChannel from one task using a heap of switching deadlines."""
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.wakeup = None
+        self.task = None
+
+    def time(self):
+        return asyncio.get_event_loop().time()
+
+    def channel(self, name, switch, **settings):
+        return SlowPWMChannel(self, name, switch, **settings)
+
+    def schedule(self, channel, deadline):
+        """(Re)schedules a channel; earlier heap entries for it become stale."""
+        if channel.closed:
+            return
+        channel.version += 1
+        heapq.heappush(self.heap, (deadline, next(self.counter), channel.version, channel))
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+        if self.heap[0][3] is channel:
+            self.wakeup.set()
+
+    async def run(self):
+        while True:
+            now = self.time()
+            while self.heap and self.heap[0][0] <= now:
+                deadline, _, version, channel = heapq.heappop(self.heap)
+                if version != channel.version or channel.closed:
+                    continue
+                nextDeadline = channel.evaluate(now)
+                if nextDeadline is not None:
+                    channel.version += 1
+                    heapq.heappush(self.heap, (nextDeadline, next(self.counter), channel.version, channel))
+            self.wakeup.clear()
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+_scheduler = None
+
+def scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = SlowPWMScheduler()
+    return _scheduler
+
+def channel(name, switch, **settings):
+    """Creates a channel on the shared scheduler."""
+    return scheduler().channel(name, switch, **settings)
@@ -0,0 +1,122 @@
+# filename: snapshot.py
+
+import asyncio
+import decimal
+import json
+import logging
+from aiohttp import web
+
+import clock
+import event
+import interfaces
+from common import app, components
+
+logger = logging.getLogger(__name__)
+
+SENSOR_READINGS = {'temperature': 'temp', 'gravity': 'gravity', 'abv': 'abv', 'atten': 'atten', 'ograv': 'ograv'}
+
+def toJson(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
+
+class Snapshot:
+    """Details of every controller, sensor and actor in one JSON document.
+
+    Any event on the bus marks the state as changed; changes within
+    settleTime are published together as one new version. The document is
+    only rebuilt when it is requested after a new version, and long-polling
+    clients are woken once per version.
+    """
+
+    def __init__(self, settleTime=0.1):
+        self.settleTime = settleTime
+        self.version = 0
+        self.publishHandle = None
+        self.changed = None
+        self.body = None
+        self.bodyVersion = None
+        self.builds = 0
+        self.subscribers = []
+        event.listen(self.onEvent)
+
+    def onEvent(self, e):
+        if self.publishHandle is None:
+            self.publishHandle = asyncio.get_event_loop().call_later(self.settleTime, self.publish)
+
+    def publish(self):
+        self.publishHandle = None
+        self.version += 1
+        if self.changed is not None:
+            self.changed.set()
+            self.changed = None
+        for subscriber in self.subscribers:
+            subscriber(self.version)
+
+    async def wait(self, since, timeout):
+        """Returns once the version is newer than since, or after timeout seconds."""
+        if self.version > since:
+            return
+        if self.changed is None:
+            self.changed = asyncio.Event()
+        changed = self.changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    @staticmethod
+    def readings(sensor):
+        readings = {}
+        for key, method in SENSOR_READINGS.items():
+            if callable(getattr(sensor, method, None)):
+                try:
+                    readings[key] = getattr(sensor, method)()
+                except Exception as e:
+                    logger.debug(f"{sensor.name}: {method}() failed: {e}")
+                    readings[key] = None
+        return readings
+
+    def collect(self, history=False):
+        controllers, sensors, actors = {}, {}, {}
+        for name, component in list(components.items()):
+            if isinstance(component, interfaces.Sensor):
+                sensors[name] = self.readings(component)
+            elif isinstance(component, interfaces.Actor):
+                actors[name] = {'power': component.getPower()}
+            elif callable(getattr(component, 'getDetails', None)) and hasattr(component, 'history'):
+                controllers[name] = component.getDetails()
+                if history and name != 'System':
+                    controllers[name]['history'] = component.history.asDict()
+        return {'version': self.version, 'time': clock.time(),
+                'controllers': controllers, 'sensors': sensors, 'actors': actors}
+
+    def build(self, history=False):
+        """Returns the snapshot as JSON bytes; without history it is cached until the next version."""
+        if history:
+            return json.dumps(self.collect(history=True), default=toJson).encode('utf-8')
+        if self.bodyVersion != self.version:
+            self.body = json.dumps(self.collect(), default=toJson).encode('utf-8')
+            self.bodyVersion = self.version
+            self.builds += 1
+        return self.body
+
+snapshot = Snapshot()
+
+async def snapshotView(request):
+    """GET /snapshot[?history=1][&since=<version>[&timeout=<seconds>]]
+
+    With since, the response is held until there is a newer version than
+    since or the timeout (default 30 s) passes, whichever comes first.
+    """
+    try:
+        since = int(request.query['since']) if 'since' in request.query else None
+        timeout = min(float(request.query.get('timeout', 30)), 300)
+    except ValueError:
+        raise web.HTTPBadRequest(reason='since must be an integer and timeout a number')
+    if since is not None:
+        await snapshot.wait(since, timeout)
+    body = snapshot.build(history=request.query.get('history') in ('1', 'true'))
+    return web.Response(body=body, content_type='application/json', headers={'Cache-Control': 'no-cache'})
+
+app.router.add_get('/snapshot', snapshotView)
@@ -0,0 +1,133 @@
+# filename: sse.py
+
+import asyncio
+import fnmatch
+import json
+import logging
+from collections import OrderedDict
+from aiohttp import web
+
+import event
+from common import app
+from snapshot import snapshot, toJson
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE = 15.0
+
+class Client:
+    """One Server-Sent Events stream with a bounded buffer that keeps only the latest message per key.
+
+    A slow client therefore skips intermediate values instead of making the
+    buffer (or the server) grow: the next snapshot replaces an unsent one,
+    and a new event replaces an unsent event on the same topic.
+    """
+
+    def __init__(self, topics, snapshots, histories, size=64):
+        self.topics = topics
+        self.snapshots = snapshots
+        self.histories = histories
+        self.size = size
+        self.buffer = OrderedDict()
+        self.ready = asyncio.Event()
+        self.matches = {}
+        self.sent = 0
+        self.dropped = 0
+
+    def wants(self, topic):
+        if topic not in self.matches:
+            self.matches[topic] = any(fnmatch.fnmatchcase(topic, pattern) for pattern in self.topics)
+        return self.matches[topic]
+
+    def put(self, key, message):
+        if key in self.buffer:
+            del self.buffer[key]
+            self.dropped += 1
+        elif len(self.buffer) >= self.size:
+            self.buffer.popitem(last=False)
+            self.dropped += 1
+        self.buffer[key] = message
+        self.ready.set()
+
+    def take(self):
+        messages = list(self.buffer.values())
+        self.buffer.clear()
+        self.ready.clear()
+        return messages
+
+class EventStreams:
+    """Fans bus events, snapshot versions and history appends out to SSE clients."""
+
+    def __init__(self):
+        self.clients = set()
+        event.listen(self.onEvent)
+        snapshot.subscribers.append(self.onSnapshot)
+
+    def onEvent(self, e):
+        if not self.clients:
+            return
+        topic = e.name()
+        for client in self.clients:
+            if e.endpoint == 'history':
+                if e.source in client.histories or '*' in client.histories:
+                    client.put(('history', e.source), ('history', {'controller': e.source, 'row': e.data}))
+            elif client.wants(topic):
+                client.put(('event', topic), ('event', {'topic': topic, 'data': e.data}))
+
+    def onSnapshot(self, version):
+        for client in self.clients:
+            if client.snapshots:
+                client.put(('snapshot',), ('snapshot', None))
+
+    @staticmethod
+    def format(kind, data):
+        if kind == 'snapshot':
+            # Built once per version and shared by every client
+            body = snapshot.build()
+            return b'event: snapshot\nid: %d\ndata: ' % snapshot.version + body + b'\n\n'
+        return f"event: {kind}\ndata: {json.dumps(data, default=toJson)}\n\n".encode('utf-8')
+
+    async def handle(self, request):
+        """GET /events?topics=Fridge.*,TiltYellow.gravity&snapshot=1&history=Fridge
+
+        topics are shell-style patterns for bus events, snapshot=1 streams
+        the /snapshot document on every change, history lists controllers
+        (or *) whose history appends are streamed.
+        """
+        split = lambda value: [item for item in value.split(',') if item]
+        client = Client(split(request.query.get('topics', '')),
+                        request.query.get('snapshot', '0') in ('1', 'true'),
+                        split(request.query.get('history', '')))
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                               'X-Accel-Buffering': 'no'})
+        await response.prepare(request)
+        self.clients.add(client)
+        try:
+            if client.snapshots:
+                await response.write(self.format('snapshot', None))
+            while True:
+                try:
+                    await asyncio.wait_for(client.ready.wait(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    await response.write(b': keepalive\n\n')
+                    continue
+                for kind, data in client.take():
+                    await response.write(self.format(kind, data))
+                    client.sent += 1
+        except ConnectionResetError:
+            pass
+        finally:
+            self.clients.discard(client)
+            if client.dropped:
+                logger.debug(f"SSE client from {request.remote} skipped {client.dropped} stale messages")
+        return response
+
+    async def stats(self, request):
+        return web.json_response([{'topics': c.topics, 'snapshots': c.snapshots, 'histories': c.histories,
+                                   'buffered': len(c.buffer), 'sent': c.sent, 'dropped': c.dropped}
+                                  for c in self.clients])
+
+streams = EventStreams()
+
+app.router.add_get('/events', streams.handle)
+app.router.add_get('/events/stats', streams.stats)
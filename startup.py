@@ -0,0 +1,250 @@
+# filename: startup.py
+
+import asyncio
+import importlib
+import inspect
+import logging
+import time
+from aiohttp import web
+
+import clock
+import controller
+import interfaces
+import middleware
+import scheduler
+from common import app, components
+
+logger = logging.getLogger(__name__)
+
+COMPONENT_TYPES = ['sensors', 'actors', 'extensions']
+
+class Step:
+    """Setting up one configured component once the components it depends on are ready."""
+
+    def __init__(self, name, kind, attribs, deps):
+        self.name = name
+        self.kind = kind
+        self.attribs = attribs
+        self.deps = deps
+        self.status = 'pending'
+        self.error = None
+        self.importTime = 0.0
+        self.initTime = 0.0
+        # Components and controllers this one added besides itself (FermenterSimulator)
+        self.contributed = []
+        self.done = asyncio.get_event_loop().create_future()
+
+    def getReport(self):
+        return {'name': self.name, 'kind': self.kind, 'plugin': self.attribs.get('plugin'), 'status': self.status,
+                'error': self.error, 'importTime': round(self.importTime, 3), 'initTime': round(self.initTime, 3)}
+
+class Startup:
+    """Builds the components of config.yaml as a dependency graph.
+
+    Plugin modules are imported on a thread pool when a component first
+    refers to them, and components (and their actors' initial off()) are set
+    up concurrently as soon as what they depend on is ready. Controllers
+    depend on their sensor and actor; controllers contributed by a component
+    (FermenterSimulator) are added once it is built. A component that fails
+    or exceeds its timeout is left out and the controllers depending on it
+    are skipped, instead of stalling or aborting the whole start.
+
+    With partial set, only the components in config are added to the
+    running ones (config reload).
+
+    Settings (the optional 'startup' section):
+      timeout:        seconds for importing a plugin or switching an actor off (default 10)
+      workers:        threads importing plugins (default 4)
+    Components can override the timeout with 'startupTimeout'.
+    """
+
+    def __init__(self, config, partial=False):
+        settings = config.get('startup') or {}
+        self.config = config
+        self.partial = partial
+        self.timeout = float(settings.get('timeout', 10))
+        self.pool = interfaces.offloadPool('startup', settings.get('workers', 4))
+        # Timeouts follow the loop's clock, which a virtual clock fast-forwards while waiting on threads
+        self.virtual = isinstance(asyncio.get_event_loop(), clock.VirtualTimeEventLoop)
+        self.steps = {}
+        self.order = []
+        self.tasks = []
+        self.imports = {}
+        self.total = None
+
+    def timeoutFor(self, attribs):
+        return None if self.virtual else float(attribs.get('startupTimeout', self.timeout))
+
+    async def importPlugin(self, plugin, timeout):
+        """Imports plugins.<plugin> once, however many components use it; returns (module, seconds)."""
+        if plugin not in self.imports:
+            async def load():
+                started = time.monotonic()
+                module = await self.pool.run(importlib.import_module, f'plugins.{plugin}', timeout=timeout)
+                return module, time.monotonic() - started
+            self.imports[plugin] = asyncio.ensure_future(load())
+        return await asyncio.shield(self.imports[plugin])
+
+    def add(self, name, kind, attribs, deps=()):
+        if name in self.steps:
+            logger.error(f"Duplicate component {name}, ignoring the {kind} definition")
+            return
+        step = Step(name, kind, attribs, list(deps))
+        self.steps[name] = step
+        self.order.append(name)
+        self.tasks.append(asyncio.ensure_future(self.runStep(step)))
+
+    def addController(self, name, attribs):
+        deps = [attribs.get('sensor'), attribs.get('actor')]
+        # Controllers pick up the Onewire sensor, when there is one, for w1temperature
+        if 'Onewire' in self.steps:
+            deps.append('Onewire')
+        self.add(name, 'controller', attribs, deps)
+
+    async def runStep(self, step):
+        for dep in step.deps:
+            if dep not in self.steps:
+                # Possibly contributed by another component, e.g. the actors of FermenterSimulator
+                await asyncio.gather(*(s.done for s in list(self.steps.values()) if s.kind != 'controller'))
+                if dep not in components:
+                    step.status, step.error = 'skipped', f"unknown component {dep}"
+                    break
+            elif not await self.steps[dep].done:
+                step.status, step.error = 'skipped', f"{dep} is not available"
+                break
+        if step.status == 'skipped':
+            logger.error(f"Not setting up {step.kind} {step.name}: {step.error}")
+            step.done.set_result(False)
+            return
+
+        timeout = self.timeoutFor(step.attribs)
+        began = time.monotonic()
+        component = None
+        try:
+            module, step.importTime = await self.importPlugin(step.attribs['plugin'], timeout)
+            started = time.monotonic()
+            existing = set(components)
+            component = self.build(step, module)
+            step.contributed = [name for name in components if name not in existing]
+            if step.kind == 'actor':
+                # Explicitly set all actors to off at initialization
+                result = component.off()
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, timeout)
+                # Most actors switch in the background, so off() returning does not mean the hardware is off
+                await asyncio.wait_for(component.confirmOff(), timeout)
+                logger.info(f"Actor {step.name} initialized to OFF state.")
+            # Actors only become available (to connections and controllers) once they are known to be off
+            components[step.name] = component
+            step.initTime = time.monotonic() - started
+            if hasattr(component, 'getControllerConfigs'):
+                for ctrl in component.getControllerConfigs():
+                    for name, attribs in ctrl.items():
+                        step.contributed.append(name)
+                        self.addController(name, attribs)
+            step.status = 'ok'
+        except asyncio.TimeoutError:
+            step.status, step.error = 'timeout', f"no answer within {timeout} s"
+        except Exception as e:
+            step.status, step.error = 'failed', f"{type(e).__name__}: {e}"
+        if step.status != 'ok':
+            step.importTime = step.importTime or time.monotonic() - began
+            logger.error(f"Failed to set up {step.kind} {step.name}: {step.error}")
+            if component is not None:
+                # Half set up, e.g. an actor that never confirmed off: nothing may use or keep running it
+                components.pop(step.name, None)
+                middleware.wrapped.pop(step.name, None)
+                scheduler.scheduler().cancelOwner(component)
+                component.stop()
+        step.done.set_result(step.status == 'ok')
+
+    def build(self, step, module):
+        attribs = step.attribs
+        logger.info(f"Setting up {step.kind}: {step.name}")
+        if step.kind == 'actor':
+            return middleware.wrap(module.factory(step.name, attribs), attribs.get('middleware'))
+        if step.kind != 'controller':
+            return module.factory(step.name, attribs)
+        logic = module.factory(step.name, attribs['logicCoeffs'])
+        return controller.Controller(step.name, components[attribs['sensor']], components[attribs['actor']], logic,
+                                     attribs.get('initialSetpoint', 67.0),
+                                     True if attribs.get('initialState', 'on') == 'on' else False,
+                                     controlMode=attribs.get('controlMode', 'poll'),
+                                     pollInterval=attribs.get('pollInterval', 10),
+                                     minInterval=attribs.get('minInterval', 2),
+                                     watchdogInterval=attribs.get('watchdogInterval', 60),
+                                     profile=attribs.get('profile'),
+                                     analyticsSettings=attribs.get('analytics'))
+
+    def checkConnections(self):
+        for conn in self.config.get('connections') or []:
+            for endpoint in conn.split('=>'):
+                name = endpoint.strip().split('.')[0]
+                if name not in components:
+                    logger.warning(f"Connection {conn} refers to {name}, which is not available")
+
+    async def run(self):
+        started = time.monotonic()
+        for componentType in COMPONENT_TYPES:
+            kind = componentType[:-1]
+            if not self.config.get(componentType):
+                if not self.partial:
+                    logger.warning(f"No {componentType}")
+                continue
+            for component in self.config[componentType]:
+                for name, attribs in component.items():
+                    self.add(name, kind, attribs)
+        for ctrl in self.config.get('controllers') or []:
+            for name, attribs in ctrl.items():
+                self.addController(name, attribs)
+
+        # Steps add the controllers they contribute while running
+        while not all(task.done() for task in self.tasks):
+            await asyncio.gather(*self.tasks)
+
+        if not self.partial:
+            self.sortComponents()
+        self.checkConnections()
+        self.total = time.monotonic() - started
+        self.logReport()
+        return self
+
+    def sortComponents(self):
+        # Keep components in config order, as the web UI lists them that way
+        isController = lambda name: name in self.steps and self.steps[name].kind == 'controller'
+        ordered = {name: components.pop(name) for name in self.order if name in components and not isController(name)}
+        ordered.update({name: component for name, component in components.items() if not isController(name)})
+        ordered.update({name: components[name] for name in self.order if name in components and isController(name)})
+        components.clear()
+        components.update(ordered)
+
+    def getReport(self):
+        steps = [self.steps[name].getReport() for name in self.order]
+        return {'total': None if self.total is None else round(self.total, 3),
+                'imports': {plugin: round(task.result()[1], 3) for plugin, task in self.imports.items()
+                            if task.done() and not task.exception()},
+                'components': sorted(steps, key=lambda s: s['importTime'] + s['initTime'], reverse=True)}
+
+    def logReport(self):
+        report = self.getReport()
+        failed = [s for s in report['components'] if s['status'] != 'ok']
+        logger.info(f"Started {len(report['components']) - len(failed)} components in {report['total']:.2f} s"
+                    f"{f', {len(failed)} not available' if failed else ''}")
+        for s in report['components']:
+            logger.info(f"  {s['name']:<20} {s['kind']:<10} {s['status']:<8} "
+                        f"import {s['importTime']:.3f} s  init {s['initTime']:.3f} s")
+
+current = None
+
+def run(config, loop):
+    """Sets up every configured component before the web app starts; returns the Startup."""
+    global current
+    current = Startup(config)
+    return loop.run_until_complete(current.run())
+
+async def startupReport(request):
+    if current is None:
+        raise web.HTTPServiceUnavailable(reason='Still starting')
+    return web.json_response(current.getReport())
+
+app.router.add_get('/startup', startupReport)
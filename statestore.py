@@ -0,0 +1,152 @@
+# filename: statestore.py
+
+import asyncio
+import json
+import logging
+import os
+
+import clock
+import controller
+import event
+import interfaces
+import scheduler
+from common import components
+
+logger = logging.getLogger(__name__)
+
+# Controller events that are saved without waiting for the next periodic snapshot; every
+# operator command ends with a new state version
+CHANGES = {'setpoint', 'enabled', 'automatic', 'version'}
+
+def writeFile(path, data):
+    """Replaces path with data atomically: a crash leaves either the old or the new file, never a partial one."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class StateStore:
+    """Warm-restart snapshots of every controller's setpoint, modes, manual power and logic state.
+
+    The snapshot is written every interval seconds and settle seconds after
+    an operator change, but only when it differs from the last one written.
+    Serializing a few controllers is cheap; the write and fsync run on a
+    single-worker offload pool, so a slow SD card never blocks the loop, and
+    changes made while a write is in progress are written right after it.
+    Logic state (the PID integrator) is only restored from snapshots younger
+    than maxAge seconds, as after a long stop it no longer fits the process.
+    """
+
+    def __init__(self, path='controllers.json', interval=60, settle=2.0, maxAge=3600):
+        self.path = path
+        self.interval = float(interval)
+        self.settle = float(settle)
+        self.maxAge = float(maxAge)
+        self.pool = interfaces.offloadPool('statestore', 1)
+        self.written = None
+        self.saveHandle = None
+        self.writing = None
+        self.again = False
+        self.stopped = False
+        self.stats = {'snapshots': 0, 'writes': 0, 'unchanged': 0, 'errors': 0}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot read controller state from {self.path}: {e}")
+            return {}
+
+    def restore(self):
+        """Applies the saved state to the controllers built from config; returns the names restored."""
+        saved = self.load()
+        age = clock.time() - saved.get('savedAt', 0)
+        restored = []
+        for name, state in saved.get('controllers', {}).items():
+            component = components.get(name)
+            if not isinstance(component, controller.Controller) or name == 'System':
+                continue
+            try:
+                component.setState(state, logicState=age <= self.maxAge)
+                restored.append(name)
+            except (TypeError, ValueError) as e:
+                logger.error(f"{name}: cannot restore saved state {state}: {e}")
+        if restored:
+            logger.warning(f"Restored {', '.join(restored)} from {self.path} ({age:.0f} s old"
+                           f"{', logic state not restored' if age > self.maxAge else ''})")
+        return restored
+
+    def collect(self):
+        return {'savedAt': clock.time(),
+                'controllers': {name: component.getState() for name, component in list(components.items())
+                                if isinstance(component, controller.Controller) and name != 'System'}}
+
+    def onEvent(self, e):
+        if e.endpoint in CHANGES and isinstance(components.get(e.source), controller.Controller) and self.saveHandle is None:
+            self.saveHandle = asyncio.get_event_loop().call_later(self.settle, self.save)
+
+    def save(self):
+        self.saveHandle = None
+        if self.stopped:
+            return
+        if self.writing is not None:
+            self.again = True
+        else:
+            self.writing = asyncio.ensure_future(self.write())
+
+    async def write(self, snapshot=None):
+        try:
+            while True:
+                self.again = False
+                self.stats['snapshots'] += 1
+                snapshot = snapshot or self.collect()
+                # The time stamp alone is no reason to write
+                body = json.dumps(snapshot['controllers'], sort_keys=True, default=float)
+                if body == self.written:
+                    self.stats['unchanged'] += 1
+                else:
+                    data = json.dumps(snapshot, default=float).encode('utf-8')
+                    try:
+                        await self.pool.run(writeFile, self.path, data, key=self.path, timeout=30)
+                        self.written = body
+                        self.stats['writes'] += 1
+                    except Exception as e:
+                        self.stats['errors'] += 1
+                        logger.error(f"Cannot save controller state to {self.path}: {e}")
+                if not self.again:
+                    break
+                snapshot = None
+        finally:
+            self.writing = None
+
+    async def flush(self):
+        """Writes the state as it is now, before anything else changes it, and stops saving (shutdown)."""
+        snapshot = self.collect()
+        self.stopped = True
+        scheduler.scheduler().cancelOwner(self)
+        if self.saveHandle is not None:
+            self.saveHandle.cancel()
+            self.saveHandle = None
+        if self.writing is not None:
+            await asyncio.shield(self.writing)
+        self.writing = asyncio.ensure_future(self.write(snapshot))
+        await asyncio.shield(self.writing)
+
+store = None
+
+def setup(settings=None, coordinator=None):
+    """Restores the controllers' saved state and keeps saving it; flushes on shutdown if a coordinator is given."""
+    global store
+    store = StateStore(**(settings or {}))
+    store.restore()
+    event.listen(store.onEvent)
+    scheduler.every(store.interval, store.save, name='statestore.save', phase=store.interval / 2, owner=store)
+    if coordinator is not None:
+        # Saved before the actors are switched off, so manual power survives the restart
+        coordinator.addFlush('controller state', store.flush, early=True)
+    return store
@@ -246,31 +246,20 @@ const app = Vue.createApp({
     },
   },
   mounted() {
-    // Establish connections to controllers and fetch details
-    fetch("/controllers")
+    // Fetch all controller details in one request and connect to their websockets
+    fetch("/snapshot")
       .then((response) => response.json())
       .then((data) => {
-        this.controllers = data;
-        if (data.System) {
-          fetch(data.System.url)
-            .then((res) => res.json())
-            .then((systemData) => {
-              this.newWsConnSystem(systemData.wsUrl);
-            });
+        const controllers = data.controllers;
+        this.controllers = controllers;
+        if (controllers.System) {
+          this.newWsConnSystem(controllers.System.wsUrl);
         }
-        if (data.Fridge) {
-          fetch(data.Fridge.url)
-            .then((res) => res.json())
-            .then((fridgeData) => {
-              this.newWsConnFridge(fridgeData.wsUrl);
-            });
+        if (controllers.Fridge) {
+          this.newWsConnFridge(controllers.Fridge.wsUrl);
         }
-        if (data.Heater) {
-          fetch(data.Heater.url)
-            .then((res) => res.json())
-            .then((heaterData) => {
-              this.newWsConnHeater(heaterData.wsUrl);
-            });
+        if (controllers.Heater) {
+          this.newWsConnHeater(controllers.Heater.wsUrl);
         }
       });
 
@@ -194,20 +194,19 @@ createApp({
 
         const fetchDataUrls = async () => {
             try {
-                const response = await fetch('/controllers');
+                // One request returns every controller with its history
+                const response = await fetch('/snapshot?history=1');
                 if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
                 const data = await response.json();
 
-                if (data.Fridge) {
-                    const fridgeResponse = await fetch(`${data.Fridge.url}/datahistory`);
-                    const fridgeResult = await fridgeResponse.json();
+                if (data.controllers.Fridge) {
+                    const fridgeResult = data.controllers.Fridge.history;
                     fridgeData.value = fridgeResult;
                     originalGravity.value = fridgeResult.ograv?.[0] || null;
                 }
 
-                if (data.Heater) {
-                    const heaterResponse = await fetch(`${data.Heater.url}/datahistory`);
-                    heaterData.value = await heaterResponse.json();
+                if (data.controllers.Heater) {
+                    heaterData.value = data.controllers.Heater.history;
                 }
             } catch (error) {
                 console.error('Error fetching data URLs:', error);
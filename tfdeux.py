@@ -1,17 +1,13 @@
 # filename: tfdeux.py
 
-import asyncio
-import importlib
 import logging
 import os
 import sys
 from aiohttp import web
 from ruamel.yaml import YAML
 
-import controller
-import event
-import interfaces
-from common import app, components
+import assets
+import clock
 
 yaml = YAML(typ='safe')
 configFile = 'config.yaml'
@@ -21,6 +17,19 @@ print(f"Using config from {configFile}")
 
 config = yaml.load(open(configFile, mode='r'))
 
+# The event loop (wall or virtual time) must be installed before common creates the app
+loop = clock.install(config.get('clock'))
+
+import controller
+import hotreload
+import profiles
+import shutdown
+import snapshot
+import sse
+import startup
+import statestore
+from common import app, components, dispatchRoute
+
 logLevel = getattr(logging, config.get('logLevel', 'WARNING').upper(), logging.WARNING)
 logging.basicConfig(level=logLevel, format='%(asctime)s:%(levelname)s:%(name)s:%(message)s', filename='tfdeux.log', filemode='w+')
 logger = logging.getLogger(__name__)
@@ -34,50 +43,14 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "plugins"))
 
 if 'connections' in config and config['connections']:
     for conn in config['connections']:
-        sendEvent, recvEvent = conn.split('=>')
-        sendComponent, sendType = sendEvent.split('.')
-        recvComponent, recvType = recvEvent.split('.')
-        event.register(
-            sendEvent, 
-            lambda event, rc=recvComponent, rt=recvType: components[rc].callback(rt, event)
-        )
+        hotreload.connect(conn)
 else:
     logger.warning(f"No connections")
 
-for componentType in ['sensors', 'actors', 'extensions']:
-    if componentType in config and config[componentType]:
-        for component in config[componentType]:
-            for name, attribs in component.items():
-                logger.info(f"Setting up {componentType}: {name}")
-                plugin = importlib.import_module(f'plugins.{attribs["plugin"]}')
-                components[name] = plugin.factory(name, attribs)
-    else:
-        logger.warning(f"No {componentType}")
-
-# Explicitly set all actors to off at initialization
-if 'actors' in config and config['actors']:
-    for component in config['actors']:
-        for name in component:
-            try:
-                actor = components.get(name)
-                if actor:
-                    actor.off()
-                    logger.info(f"Actor {name} initialized to OFF state.")
-                else:
-                    logger.warning(f"Actor {name} not found in components.")
-            except Exception as e:
-                logger.error(f"Failed to initialize actor {name} to OFF state: {e}")
-
-for ctrl in config['controllers']:
-    for name, attribs in ctrl.items():
-        logger.info(f"Setting up controller: {name}")
-        logicPlugin = importlib.import_module(f'plugins.{attribs["plugin"]}')
-        logic = logicPlugin.factory(name, attribs['logicCoeffs'])
-        sensor = components[attribs['sensor']]
-        actor = components[attribs['actor']]
-        initialSetpoint = attribs.get('initialSetpoint', 67.0)
-        initiallyEnabled = True if attribs.get('initialState', 'on') == 'on' else False
-        components[name] = controller.Controller(name, sensor, actor, logic, initialSetpoint, initiallyEnabled)
+profiles.configure(config.get('profiles'), config.get('profileState', 'profiles.json'))
+
+# Sensors, actors, extensions and controllers, set up concurrently before the web app starts
+startup.run(config, loop)
 
 # Add the System controller
 logger.info("Setting up controller: System")
@@ -90,14 +63,11 @@ components["System"] = controller.Controller(
     initiallyEnabled=False  # System is not enabled by default
 )
 
-async def start_background_tasks(app):
-    pass
+# Actors off, components stopped and queues flushed within a deadline on exit
+coordinator = shutdown.setup(app, config.get('shutdown'))
 
-async def cleanup_background_tasks(app):
-    pass
-
-app.on_startup.append(start_background_tasks)
-app.on_cleanup.append(cleanup_background_tasks)
+# Setpoints, modes and logic state continue where they were before a restart
+statestore.setup(config.get('state'), coordinator)
 
 isWebUIenabled = config.get('enableWebUI', False)
 async def rootRouteHandler(request):
@@ -109,9 +79,25 @@ async def rootRouteHandler(request):
 app.router.add_get('/', rootRouteHandler)
 
 if isWebUIenabled:
-    app.router.add_static('/static', 'static/')
+    assets.setup(app, 'static', cacheDir=config.get('assetCache', '.assetcache'))
+
+# Routes of components (added with common.addRoute) come last, after every fixed route
+app.router.add_route('*', '/{path:.*}', dispatchRoute)
+
+def loadConfig(path):
+    with open(path, mode='r') as f:
+        return yaml.load(f)
+
+hotreload.setup(configFile, config, loadConfig, loop)
+
+def stopSimulation(duration):
+    # Loop time is the simulated time on a virtual clock and a monotonic counter on the wall clock
+    logger.warning(f"Ran for the configured {duration:g} s, stopping")
+    raise web.GracefulExit()
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
+    duration = (config.get('clock') or {}).get('duration')
+    if duration:
+        loop.call_later(float(duration), stopSimulation, float(duration))
     web.run_app(app, port=config.get('port', 8080), loop=loop)
 